@@ -0,0 +1,89 @@
+"""Benchmark the in-process search engine against the `grep -rn` subprocess path.
+
+Usage:
+    python -m benchmarks.grep_search_benchmark [path] [--pattern REGEX] [--runs N]
+
+Without a path, a synthetic tree (source files plus a large node_modules
+and .venv) is generated in a temporary directory.
+"""
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from src.tools.search_engine import search
+
+
+def _generate_tree(root: Path, packages: int = 200, files_per_package: int = 50) -> None:
+    """Create a synthetic repository with vendored directories."""
+    (root / ".gitignore").write_text("build/\n*.log\n")
+    body = "".join(f"def function_{i}(value):\n    return value * {i}\n\n" for i in range(40))
+    for vendored in ("node_modules", ".venv", "build"):
+        for package in range(packages // 2):
+            directory = root / vendored / f"pkg_{package}"
+            directory.mkdir(parents=True, exist_ok=True)
+            for index in range(files_per_package):
+                (directory / f"module_{index}.js").write_text(body)
+    for package in range(packages):
+        directory = root / "src" / f"package_{package}"
+        directory.mkdir(parents=True, exist_ok=True)
+        for index in range(files_per_package):
+            text = body + ("# TODO: needle\n" if index % 97 == 0 else "")
+            (directory / f"module_{index}.py").write_text(text)
+
+
+def _time(function, runs: int) -> float:
+    """Median wall-clock time of a function in seconds."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run(root: Path, pattern: str, runs: int) -> None:
+    def grep_subprocess():
+        subprocess.run(["grep", "-rn", pattern, str(root)],
+                       capture_output=True, text=True, timeout=300)
+
+    def engine():
+        search(root, pattern, max_results=10_000, workspace=root)
+
+    def engine_first_match():
+        search(root, pattern, max_results=1, workspace=root)
+
+    grep_output = subprocess.run(["grep", "-rn", pattern, str(root)],
+                                 capture_output=True, text=True).stdout
+    result = search(root, pattern, max_results=10_000, workspace=root)
+
+    print(f"Tree: {root}")
+    print(f"Pattern: {pattern!r}, runs: {runs}")
+    print(f"grep -rn subprocess       {_time(grep_subprocess, runs) * 1000:9.1f} ms  "
+          f"({len(grep_output.splitlines())} lines, {len(grep_output)} bytes)")
+    print(f"search engine             {_time(engine, runs) * 1000:9.1f} ms  "
+          f"({len(result.matches)} matches, {result.files_searched} files searched)")
+    print(f"search engine (1 result)  {_time(engine_first_match, runs) * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="Tree to search (default: synthetic tree)")
+    parser.add_argument("--pattern", default="TODO: needle")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.path:
+        run(Path(args.path), args.pattern, args.runs)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        _generate_tree(root)
+        run(root, args.pattern, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """ACP Agent implementation using the official SDK."""
 import os
+import time
 import uuid
 
 import acp
@@ -7,6 +8,7 @@ from acp import Agent, Client
 from acp.schema import (
     InitializeResponse,
     NewSessionResponse,
+    LoadSessionResponse,
     PromptResponse,
     ClientCapabilities,
     Implementation,
@@ -18,16 +20,26 @@ from acp.schema import (
     ToolCallStart,
     ToolCallProgress,
     AgentMessageChunk,
+    UserMessageChunk,
     ContentToolCallContent,
     AgentThoughtChunk,
 )
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, \
+    HumanMessage, message_chunk_to_message
 
 from src.acp.session import SessionManager
-from src.model import create_model, load_system_prompt
-from src.utils.prompt_compaction import compact_messages_if_needed
-from src.tools.tool import get_all_tools, execute_tool
-from src.mcp.mcp_tools import cleanup_mcp_connections
+from src.acp.tool_progress import ToolOutputStreamer
+from src.model import format_token_usage, get_model_with_tools, \
+    load_system_prompt
+from src.utils.prompt_compaction import OVERFLOW_RETRY_THRESHOLD, \
+    compact_messages_if_needed, is_context_overflow_error
+from src.tools.artifact_store import use_artifact_store
+from src.tools.command_tools import command_output_listener
+from src.tools.tool import get_all_tools, get_tool_registry, execute_tool, \
+    ToolRegistry
+from src.tools.tool_executor import execute_tool_calls
+from src.tools.workspace import workspace_root
+from src.mcp.mcp_tools import cleanup_mcp_connections, start_mcp_servers
 import sys
 from langchain_core.messages import ToolCall
 
@@ -43,7 +55,6 @@ class ACPAgent(Agent):
     def __init__(self):
         self.conn: Client | None = None
         self.session_manager = SessionManager()
-        self._tools = None  # Lazy-loaded tools
 
     def on_connect(self, conn: Client) -> None:
         """Called when client connects - store connection for sending updates."""
@@ -61,10 +72,12 @@ class ACPAgent(Agent):
 
         Negotiates protocol version and exchanges capability information.
         """
+        # Connect MCP servers in the background while the client sets up
+        start_mcp_servers()
         return InitializeResponse(
             protocol_version=1,
             agent_capabilities=acp.schema.AgentCapabilities(
-                load_session=False,  # Set to True if you implement session persistence
+                load_session=True,  # Sessions are journaled to disk
                 prompt_capabilities=acp.schema.PromptCapabilities(
                     audio=False,
                     embedded_context=False,
@@ -103,16 +116,7 @@ class ACPAgent(Agent):
 
         return NewSessionResponse(
             session_id=session.session_id,
-            modes=acp.schema.SessionModeState(
-                current_mode_id="auto",
-                available_modes=[
-                    acp.schema.SessionMode(
-                        id="auto",
-                        name="Auto",
-                        description="Autonomous coding agent mode"
-                    )
-                ]
-            ),
+            modes=self._session_modes(),
             models=acp.schema.SessionModelState(
                 current_model_id=model_id,
                 available_models=[
@@ -124,6 +128,53 @@ class ACPAgent(Agent):
             )
         )
 
+    async def load_session(
+            self,
+            cwd: str,
+            session_id: str,
+            mcp_servers: list = None,
+            **kwargs
+    ) -> LoadSessionResponse:
+        """
+        Handle session/load request.
+
+        Rebuilds the session from its journal (no model calls) and replays
+        the conversation to the client.
+        """
+        session = self.session_manager.get_session(session_id)
+        if session is None:
+            raise ValueError(f"Session not found: {session_id}")
+        session.cwd = cwd
+
+        for message in session.messages:
+            if isinstance(message, HumanMessage):
+                await self.conn.session_update(
+                    session_id,
+                    UserMessageChunk(
+                        session_update="user_message_chunk",
+                        content=TextContentBlock(type="text",
+                                                 text=message.text)
+                    )
+                )
+            elif isinstance(message, AIMessage):
+                await self._stream_content_blocks(session_id, message)
+
+        return LoadSessionResponse(modes=self._session_modes())
+
+    @staticmethod
+    def _session_modes() -> acp.schema.SessionModeState:
+        """Session modes offered to the client."""
+        return acp.schema.SessionModeState(
+            current_mode_id="auto",
+            available_modes=[
+                acp.schema.SessionMode(
+                    id="auto",
+                    name="Auto",
+                    description="Autonomous coding agent mode"
+                )
+            ]
+        )
+
     async def cancel(self, session_id: str, **kwargs) -> None:
         """
         Handle session/cancel notification.
@@ -156,13 +207,23 @@ class ACPAgent(Agent):
         # Reset cancellation flag for new prompt turn
         session.reset_cancellation()
 
+        # A session is never offloaded while its prompt turn runs
+        session.busy = True
+        try:
+            # Tools called during this turn operate in the session's cwd and
+            # read the session's artifacts
+            with workspace_root(session.cwd), use_artifact_store(session.artifacts):
+                return await self._run_prompt(session_id, session, prompt)
+        finally:
+            session.busy = False
+            session.touch()
+
+    async def _run_prompt(self, session_id: str, session, prompt: list) -> PromptResponse:
+        """Run the agent loop for one prompt turn."""
         # Extract user text from prompt content
         user_text = self._extract_prompt_content(prompt)
         session.add_user_message(user_text)
-
-        # Get tools and model
-        tools = await self._get_tools()
-        model = create_model().bind_tools(tools)
+        session.tool_selector.start_turn(user_text)
 
         # Agent loop - may include multiple tool calls
         while True:
@@ -170,15 +231,50 @@ class ACPAgent(Agent):
             if session.is_cancelled():
                 return PromptResponse(stop_reason="cancelled")
 
-            response: AIMessage = await model.ainvoke(session.messages)
+            # Get tools and model (MCP servers that finished connecting
+            # since the last turn contribute their tools)
+            all_tools = await get_all_tools()
+            tools = get_tool_registry(session.tool_selector.get_tools(all_tools))
+            # Bind only the tools relevant to this turn
+            model = get_model_with_tools(
+                session.tool_selector.select(all_tools, session.messages))
+
+            # Turn boundary: swap in background compaction, or compact
+            # before sending if the projected request is too large
+            session.set_messages(await session.compactor.before_request(
+                session.messages))
+            try:
+                response = await self._stream_model_response(session_id,
+                                                             session,
+                                                             model)
+            except Exception as e:
+                if not is_context_overflow_error(e):
+                    raise
+                # Provider rejected the request as too long - compact and retry
+                print(f"Context overflow, compacting and retrying: {e}",
+                      file=sys.stderr)
+                session.set_messages(await compact_messages_if_needed(
+                    messages=session.messages,
+                    current_input_tokens=0,
+                    threshold=OVERFLOW_RETRY_THRESHOLD,
+                    force=True
+                ))
+                response = await self._stream_model_response(session_id,
+                                                             session,
+                                                             model)
+            # Check for cancellation during the streamed LLM response
+            if response is None:
+                return PromptResponse(stop_reason="cancelled")
             session.add_ai_message(response)
+            print(format_token_usage(response.usage_metadata), file=sys.stderr)
 
-            # Check if we need to compact messages based on input token usage
+            # Start background compaction (soft threshold) or compact now
+            # (hard threshold) based on input token usage
             input_tokens = response.usage_metadata.get("input_tokens", 0) if response.usage_metadata else 0
-            session.messages = await compact_messages_if_needed(
+            session.set_messages(await session.compactor.after_response(
                 messages=session.messages,
                 current_input_tokens=input_tokens
-            )
+            ))
             # Check for cancellation after LLM response
             if session.is_cancelled():
                 return PromptResponse(stop_reason="cancelled")
@@ -187,45 +283,86 @@ class ACPAgent(Agent):
                 print(
                     f"Tool calls detected!, list of tool call is {response.tool_calls}",
                     file=sys.stderr)
-                # Stream reasoning/text blocks if present
-                await self._stream_content_blocks(session_id, response)
-
-                # Process tool calls
-                for tool_call in response.tool_calls:
-                    await self._process_tool_call(session_id,
-                                                  session,
-                                                  tools,
-                                                  tool_call)
+
+                # Process tool calls concurrently, keep history order
+                results = await execute_tool_calls(
+                    tools,
+                    response.tool_calls,
+                    run_tool=lambda tool_call: self._process_tool_call(
+                        session_id, tools, tool_call)
+                )
+                for tool_call, result in zip(response.tool_calls, results):
+                    session.add_tool_message(result, tool_call["id"],
+                                             tool_call["name"])
             else:
-                # No more tool calls - stream agent message and end turn
-                await self._stream_content_blocks(session_id, response)
+                # No more tool calls - agent message was streamed, end turn
                 break
 
         return PromptResponse(stop_reason="end_turn")
 
-    async def _get_tools(self):
-        """Lazy load tools."""
-        if self._tools is None:
-            self._tools = await get_all_tools()
-        return self._tools
+    async def _stream_model_response(self, session_id: str, session,
+                                     model) -> AIMessage | None:
+        """
+        Stream the model response to the client as it is generated.
+
+        Reasoning and text deltas are forwarded as soon as they arrive while
+        the chunks (including partial tool call arguments) are merged into
+        the final message stored in history.
+
+        Args:
+            session_id: The session ID for the client connection
+            session: The session object
+            model: The chat model with tools bound
+
+        Returns:
+            The assembled AIMessage, or None if the session was cancelled
+        """
+        started_at = time.perf_counter()
+        time_to_first_token = None
+        full_response: AIMessageChunk | None = None
+
+        async for chunk in model.astream(session.messages):
+            if session.is_cancelled():
+                return None
+
+            if time_to_first_token is None and chunk.content:
+                time_to_first_token = time.perf_counter() - started_at
+                print(f"Time to first token: {time_to_first_token:.3f}s",
+                      file=sys.stderr)
+
+            await self._stream_content_blocks(session_id, chunk)
+            full_response = chunk if full_response is None else full_response + chunk
+
+        if full_response is None:
+            return AIMessage(content="")
+
+        response = message_chunk_to_message(full_response)
+        response.response_metadata["time_to_first_token"] = time_to_first_token
+        response.response_metadata["response_time"] = time.perf_counter() - started_at
+        return response
 
     async def _stream_content_blocks(self, session_id: str,
-                                     response: AIMessage) -> None:
+                                     response: AIMessage | AIMessageChunk) -> None:
         """
-        Stream content blocks from an AI response to the client.
+        Stream content blocks from an AI response (or a streamed chunk) to the client.
         
         Handles reasoning blocks as thought chunks and text blocks as message chunks.
         
         Args:
             session_id: The session ID for the client connection
-            response: The AIMessage response from the model
+            response: The AIMessage response or AIMessageChunk delta from the model
         """
         if not hasattr(response,
                        'content_blocks') or not response.content_blocks:
             return
 
         for block in response.content_blocks:
-            if isinstance(block, dict) and block.get("type") == "reasoning":
+            if not isinstance(block, dict):
+                continue
+            # Skip empty deltas (e.g. signature-only thinking chunks)
+            if not block.get("reasoning") and not block.get("text"):
+                continue
+            if block.get("type") == "reasoning":
                 await self.conn.session_update(
                     session_id,
                     AgentThoughtChunk(
@@ -234,7 +371,7 @@ class ACPAgent(Agent):
                                                  text=block['reasoning'])
                     )
                 )
-            elif isinstance(block, dict) and block.get("type") == "text":
+            elif block.get("type") == "text":
                 await self.conn.session_update(
                     session_id,
                     AgentMessageChunk(
@@ -245,21 +382,22 @@ class ACPAgent(Agent):
                 )
 
 
-    async def _process_tool_call(self, session_id: str, session, tools: list,
-                                 tool_call: ToolCall):
+    async def _process_tool_call(self, session_id: str, tools: ToolRegistry,
+                                 tool_call: ToolCall) -> str:
         """
         Process a single tool call.
 
+        The caller appends the result to the session history so that
+        concurrently executed calls are stored in their original order.
+
         Args:
             session_id: The session ID
-            session: The session object
-            tools: List of available tools
+            tools: Registry of the available tools
             tool_call: The tool call dictionary
             
         Returns:
-            PromptResponse if cancellation occurs, None otherwise
+            The tool result
         """
-        tool_call_id = tool_call["id"]  # LLM's original ID for conversation history
         tool_name = tool_call["name"]
         tool_args = tool_call["args"]
         
@@ -289,9 +427,27 @@ class ACPAgent(Agent):
             )
         )
 
-        # Execute tool
-        result = await execute_tool(tools, tool_call)
-        session.add_tool_message(result, tool_call_id)
+        # Execute tool, streaming command output while it runs
+        async def send_progress(output: str):
+            await self.conn.session_update(
+                session_id,
+                ToolCallProgress(
+                    session_update="tool_call_update",
+                    tool_call_id=acp_tool_call_id,
+                    content=[ContentToolCallContent(
+                        type="content",
+                        content=TextContentBlock(type="text", text=output)
+                    )]
+                )
+            )
+
+        streamer = ToolOutputStreamer(send_progress)
+        token = command_output_listener.set(streamer.write)
+        try:
+            result = await execute_tool(tools, tool_call)
+        finally:
+            command_output_listener.reset(token)
+            await streamer.close()
 
         # Truncate long results
         truncated_result = result[:1000] if len(result) > 1000 else result
@@ -309,6 +465,7 @@ class ACPAgent(Agent):
                 )]
             )
         )
+        return result
 
     def _extract_prompt_content(self, prompt_content: list) -> str:
         """
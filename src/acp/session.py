@@ -1,9 +1,43 @@
 """Session management for ACP."""
+import sys
+import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import Optional
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, SystemMessage, BaseMessage
 
+from src.acp.session_journal import SessionJournal, load_journal, \
+    prune_journals, session_file_name
+from src.tools.artifact_store import ArtifactStore, prune_artifact_stores
+from src.tools.tool_selection import ToolSelector
+from src.utils.prompt_compaction import BackgroundCompactor, \
+    CHARS_PER_TOKEN, estimate_message_tokens
+
+# Maximum number of sessions kept in memory (least recently used are offloaded)
+MAX_ACTIVE_SESSIONS = 32
+
+# Sessions idle for longer than this are offloaded to disk (seconds)
+SESSION_IDLE_TIMEOUT = 30 * 60
+
+# Estimated memory budget shared by all in-memory sessions (bytes)
+SESSION_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Estimated Python object overhead of a message (bytes)
+MESSAGE_OVERHEAD_BYTES = 1024
+
+# Journals, snapshots and artifacts of sessions inactive for longer are deleted (seconds)
+SESSION_RETENTION = 30 * 24 * 3600
+
+# Minimum time between two prunes of the on-disk sessions (seconds)
+PRUNE_INTERVAL = 24 * 3600
+
+
+def estimate_message_memory(message: BaseMessage) -> int:
+    """Estimate the memory held by a message (bytes)."""
+    return estimate_message_tokens(message) * CHARS_PER_TOKEN + MESSAGE_OVERHEAD_BYTES
+
+
 @dataclass
 class Session:
     """Represents an ACP session with conversation history."""
@@ -11,19 +45,56 @@ class Session:
     cwd: str
     messages: list[BaseMessage] = field(default_factory=list)
     cancelled: bool = False  # Cancellation flag
+    compactor: BackgroundCompactor = field(default_factory=BackgroundCompactor)
+    artifacts: ArtifactStore = field(init=False)  # Oversized tool outputs
+    journal: Optional[SessionJournal] = None  # Persistent message log
+    tool_selector: ToolSelector = field(default_factory=ToolSelector)
+    busy: bool = False  # A prompt turn is running, never offload
+    last_active: float = field(default_factory=time.monotonic)
+    memory_estimate: int = field(init=False)  # Estimated bytes held by messages
+
+    def __post_init__(self):
+        self.artifacts = ArtifactStore(name=session_file_name(self.session_id))
+        self.memory_estimate = sum(estimate_message_memory(m) for m in self.messages)
+
+    def touch(self):
+        """Mark the session as recently used."""
+        self.last_active = time.monotonic()
+
+    def _append(self, message: BaseMessage):
+        self.messages.append(message)
+        self.memory_estimate += estimate_message_memory(message)
+        self.touch()
+        if self.journal is not None:
+            self.journal.append_message(message)
 
     def add_system_message(self, content: str):
-        self.messages.append(SystemMessage(content=content))
+        self._append(SystemMessage(content=content))
 
     def add_user_message(self, content: str):
-        self.messages.append(HumanMessage(content=content))
+        self._append(HumanMessage(content=content))
 
     def add_ai_message(self, message: AIMessage):
-        self.messages.append(message)
+        self._append(message)
+
+    def add_tool_message(self, content: str, tool_call_id: str,
+                         tool_name: str = ""):
+        # Oversized outputs are spilled to disk, history keeps a preview
+        content = self.artifacts.spill(content, tool_name)
+        self._append(ToolMessage(content=content, tool_call_id=tool_call_id))
 
-    def add_tool_message(self, content: str, tool_call_id: str):
-        self.messages.append(
-            ToolMessage(content=content, tool_call_id=tool_call_id))
+    def set_messages(self, messages: list[BaseMessage]):
+        """Replace the history (e.g. after compaction).
+
+        A replaced history is journaled as a snapshot, so loading the
+        session starts from the latest summary.
+        """
+        if messages is self.messages:
+            return
+        self.messages = messages
+        self.memory_estimate = sum(estimate_message_memory(m) for m in messages)
+        if self.journal is not None:
+            self.journal.snapshot(messages)
 
     def cancel(self):
         """Mark this session as cancelled."""
@@ -39,10 +110,26 @@ class Session:
 
 
 class SessionManager:
-    """Manages multiple ACP sessions."""
+    """Manages multiple ACP sessions.
+
+    Sessions are kept in memory in LRU order. Sessions idle for longer than
+    idle_timeout, beyond max_sessions or beyond the memory budget are
+    offloaded to compressed snapshots on disk and reloaded on the next
+    get_session(). The on-disk state of sessions inactive for longer than
+    retention is deleted at startup and then at most every PRUNE_INTERVAL.
+    """
 
-    def __init__(self):
-        self._sessions: dict[str, Session] = {}
+    def __init__(self, max_sessions: int = MAX_ACTIVE_SESSIONS,
+                 idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 memory_budget: int = SESSION_MEMORY_BUDGET,
+                 retention: float = SESSION_RETENTION):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        self.retention = retention
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._last_prune = 0.0
+        self.prune_disk()
 
     def create_session(self, cwd: str,
                        session_id: Optional[str] = None) -> Session:
@@ -50,17 +137,104 @@ class SessionManager:
         if session_id is None:
             session_id = f"sess_{uuid.uuid4().hex[:12]}"
 
-        session = Session(session_id=session_id, cwd=cwd)
+        journal = SessionJournal(session_id)
+        journal.start(cwd)
+        session = Session(session_id=session_id, cwd=cwd, journal=journal)
         self._sessions[session_id] = session
+        self._enforce_limits(keep=session_id)
+        if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+            self.prune_disk()
         return session
 
     def get_session(self, session_id: str) -> Optional[Session]:
-        """Get a session by ID."""
-        return self._sessions.get(session_id)
+        """Get a session by ID, reloading it from disk if it was offloaded."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            journal = load_journal(session_id)
+            if journal is None:
+                return None
+            cwd, messages = journal.load()
+            session = Session(session_id=session_id, cwd=cwd,
+                              messages=messages, journal=journal)
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.touch()
+        self._enforce_limits(keep=session_id)
+        return session
+
+    def offload_session(self, session_id: str) -> bool:
+        """Write a session to a compressed snapshot and drop it from memory."""
+        session = self._sessions.get(session_id)
+        if session is None or session.busy or session.journal is None:
+            return False
+        session.compactor.cancel()
+        try:
+            size = session.journal.save_snapshot(session.cwd, session.messages)
+        except OSError as e:
+            print(f"Failed to offload session {session_id}: {e}", file=sys.stderr)
+            return False
+        del self._sessions[session_id]
+        print(f"Offloaded session {session_id} "
+              f"({session.memory_estimate // 1024} KB in memory, "
+              f"{size // 1024} KB on disk)", file=sys.stderr)
+        return True
+
+    def memory_usage(self) -> dict[str, int]:
+        """Estimated memory of each in-memory session (bytes)."""
+        return {session_id: session.memory_estimate
+                for session_id, session in self._sessions.items()}
+
+    def total_memory(self) -> int:
+        """Estimated memory of all in-memory sessions (bytes)."""
+        return sum(session.memory_estimate for session in self._sessions.values())
 
     def delete_session(self, session_id: str) -> bool:
-        """Delete a session."""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        """Delete a session, its journal and snapshot."""
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.artifacts.cleanup()
+            if session.journal is not None:
+                session.journal.delete()
+            return True
+        journal = load_journal(session_id)
+        if journal is not None:
+            journal.delete()
             return True
         return False
+
+    def prune_disk(self) -> int:
+        """Delete the journals, snapshots and artifacts of inactive sessions.
+
+        Sessions in memory are kept whatever their age. Artifact stores are
+        kept as long as their session's journal is.
+
+        Returns:
+            The number of sessions (or orphaned artifact stores) deleted.
+        """
+        self._last_prune = time.monotonic()
+        in_memory = {session_file_name(session_id) for session_id in self._sessions}
+        try:
+            deleted, on_disk = prune_journals(self.retention, keep=in_memory)
+            deleted += prune_artifact_stores(self.retention, keep=in_memory | on_disk)
+        except OSError as e:
+            print(f"Failed to prune old sessions: {e}", file=sys.stderr)
+            return 0
+        if deleted:
+            print(f"Deleted {deleted} sessions or artifact stores inactive for "
+                  f"{self.retention / 86400:.0f} days", file=sys.stderr)
+        return deleted
+
+    def _enforce_limits(self, keep: str):
+        """Offload idle sessions, then least recently used ones over the limits."""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if session_id != keep and now - session.last_active > self.idle_timeout:
+                self.offload_session(session_id)
+
+        # Oldest first; the session being accessed is never offloaded
+        for session_id in list(self._sessions):
+            if (len(self._sessions) <= self.max_sessions
+                    and self.total_memory() <= self.memory_budget):
+                break
+            if session_id != keep:
+                self.offload_session(session_id)
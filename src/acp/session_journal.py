@@ -0,0 +1,256 @@
+"""Append-only JSONL journal of an ACP session's conversation.
+
+Every message added to a session is appended as one line. When the history
+is replaced (prompt compaction), the full compacted history is written as a
+snapshot record, so loading only has to parse the lines after the latest
+snapshot. Loading never calls the model.
+
+Record types:
+    {"type": "session", "cwd": ..., "created_at": ...}   first line
+    {"type": "message", "message": <message dict>}
+    {"type": "snapshot", "messages": [<message dict>, ...]}
+
+A session offloaded from memory is also saved as a gzip-compressed snapshot
+that records the journal size at that point; reloading reads the snapshot
+and replays only the journal lines written after it.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Collection, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage, \
+    message_to_dict, messages_from_dict
+
+# Directory where session journals are stored (survives server restarts)
+SESSION_ROOT = Path.home() / ".code-buddy" / "sessions"
+
+# Prefix of snapshot lines, matched without parsing the JSON
+_SNAPSHOT_PREFIX = '{"type": "snapshot"'
+
+# Longest session ID used verbatim as a file name
+_MAX_FILE_NAME_ID = 128
+
+# Files of a session on disk: journal, snapshot and an interrupted snapshot write
+_SESSION_FILE_SUFFIXES = (".jsonl", ".snapshot.json.gz", ".snapshot.json.tmp")
+
+
+def session_file_name(session_id: str) -> str:
+    """File name stem for a client-supplied session ID.
+
+    Safe IDs are used as-is; others (path separators, ':', leading '.',
+    very long) are replaced by a hash. The '~' prefix cannot occur in a
+    safe ID, so the two forms never collide.
+    """
+    if (re.fullmatch(r"[\w.-]+", session_id) and not session_id.startswith(".")
+            and len(session_id) <= _MAX_FILE_NAME_ID):
+        return session_id
+    return "~" + hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+
+
+def _split_records(text: str) -> list[str]:
+    """Split journal text into its JSON lines.
+
+    Only "\n" ends a record: json.dumps(ensure_ascii=False) keeps "\x85" and
+    "\u2028" raw, and str.splitlines() would split messages on them.
+    """
+    return [line for line in text.split("\n") if line]
+
+
+def _close_dangling_tool_calls(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Answer tool calls that never got a result with an error ToolMessage.
+
+    A crash or kill during tool execution leaves an AIMessage whose tool
+    calls have no results, and the provider rejects every later request of
+    the session.
+    """
+    repaired: list[BaseMessage] = []
+    pending: list[dict] = []  # Unanswered tool calls of the last AIMessage
+
+    def close_pending():
+        for tool_call in pending:
+            repaired.append(ToolMessage(
+                content="Error: Tool call interrupted, the agent stopped before it finished",
+                tool_call_id=tool_call["id"],
+                name=tool_call["name"],
+                status="error",
+            ))
+
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            pending = [c for c in pending if c["id"] != message.tool_call_id]
+        else:
+            close_pending()
+            pending = list(message.tool_calls) if isinstance(message, AIMessage) else []
+        repaired.append(message)
+    close_pending()
+    return repaired
+
+
+class SessionJournal:
+    """Journal file of one session."""
+
+    def __init__(self, session_id: str, root: Path = SESSION_ROOT):
+        self.session_id = session_id
+        name = session_file_name(session_id)
+        self.path = root / f"{name}.jsonl"
+        self.snapshot_path = root / f"{name}.snapshot.json.gz"
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def start(self, cwd: str) -> None:
+        """Create the journal with its header record."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._append({"type": "session", "cwd": cwd, "created_at": time.time()}, mode="w")
+
+    def append_message(self, message: BaseMessage) -> None:
+        self._append({"type": "message", "message": message_to_dict(message)})
+
+    def snapshot(self, messages: list[BaseMessage]) -> None:
+        """Record the full (compacted) history as the new starting point."""
+        self._append({"type": "snapshot", "messages": [message_to_dict(m) for m in messages]})
+
+    def save_snapshot(self, cwd: str, messages: list[BaseMessage]) -> int:
+        """Write a compressed snapshot of the full history.
+
+        Returns:
+            The compressed size in bytes.
+        """
+        with self._lock:
+            journal_offset = self.path.stat().st_size if self.path.exists() else 0
+        data = gzip.compress(json.dumps({
+            "cwd": cwd,
+            "journal_offset": journal_offset,
+            "messages": [message_to_dict(m) for m in messages],
+        }, ensure_ascii=False, default=str).encode("utf-8"), compresslevel=6)
+        temp_path = self.snapshot_path.with_suffix(".tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, self.snapshot_path)
+        return len(data)
+
+    def load(self) -> tuple[str, list[BaseMessage]]:
+        """Rebuild the session from its snapshot and/or journal.
+
+        Tool calls left without results by a crash are answered with an
+        error result.
+
+        Returns:
+            (cwd, messages)
+
+        Raises:
+            OSError: If the journal cannot be read.
+            ValueError: If the journal has no session header.
+        """
+        if self.snapshot_path.exists():
+            snapshot = json.loads(gzip.decompress(self.snapshot_path.read_bytes()))
+            with self._lock, open(self.path, "rb") as f:
+                f.seek(snapshot["journal_offset"])
+                tail = _split_records(f.read().decode("utf-8"))
+            messages = messages_from_dict(snapshot["messages"])
+            messages = self._replay(tail, messages, first_line=0)
+            return snapshot["cwd"], _close_dangling_tool_calls(messages)
+
+        with self._lock:
+            lines = _split_records(self.path.read_text(encoding="utf-8"))
+        if not lines:
+            raise ValueError(f"Empty session journal: {self.path}")
+        header = json.loads(lines[0])
+        if header.get("type") != "session":
+            raise ValueError(f"Invalid session journal: {self.path}")
+        messages = self._replay(lines[1:], [], first_line=1)
+        return header["cwd"], _close_dangling_tool_calls(messages)
+
+    def _replay(self, lines: list[str], messages: list[BaseMessage],
+                first_line: int) -> list[BaseMessage]:
+        """Apply journal lines to a history, starting at the latest snapshot."""
+        start = 0
+        for index in range(len(lines) - 1, -1, -1):
+            if lines[index].startswith(_SNAPSHOT_PREFIX):
+                start = index
+                break
+
+        for number, line in enumerate(lines[start:], start=first_line + start + 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line
+                print(f"Skipping corrupt line {number} of {self.path}", file=sys.stderr)
+                continue
+            if record["type"] == "snapshot":
+                messages = messages_from_dict(record["messages"])
+            elif record["type"] == "message":
+                messages.extend(messages_from_dict([record["message"]]))
+        return messages
+
+    def delete(self) -> None:
+        with self._lock:
+            self.path.unlink(missing_ok=True)
+            self.snapshot_path.unlink(missing_ok=True)
+
+    def _append(self, record: dict, mode: str = "a") -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock, open(self.path, mode, encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            # Persistence is best effort, never fail the conversation
+            print(f"Failed to write session journal {self.path}: {e}", file=sys.stderr)
+
+
+def load_journal(session_id: str, root: Path = SESSION_ROOT) -> Optional[SessionJournal]:
+    """Return the journal of a session if it exists on disk."""
+    journal = SessionJournal(session_id, root)
+    return journal if journal.exists() else None
+
+
+def prune_journals(max_age: float, keep: Collection[str] = (),
+                   root: Path = SESSION_ROOT) -> tuple[int, set[str]]:
+    """Delete the journals and snapshots of sessions inactive for max_age seconds.
+
+    Args:
+        keep: File names (see session_file_name) of sessions never deleted,
+            e.g. the ones in memory.
+
+    Returns:
+        (number of sessions deleted, file names of the sessions left on disk)
+    """
+    last_written: dict[str, float] = {}
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0, set()
+    for entry in entries:
+        for suffix in _SESSION_FILE_SUFFIXES:
+            if entry.name.endswith(suffix):
+                name = entry.name[:-len(suffix)]
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    break
+                last_written[name] = max(last_written.get(name, 0.0), mtime)
+                break
+
+    cutoff = time.time() - max_age
+    deleted = 0
+    remaining = set()
+    for name, mtime in last_written.items():
+        if name in keep or mtime >= cutoff:
+            remaining.add(name)
+            continue
+        for suffix in _SESSION_FILE_SUFFIXES:
+            try:
+                (root / f"{name}{suffix}").unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Failed to delete session file {name}{suffix}: {e}",
+                      file=sys.stderr)
+                remaining.add(name)
+        deleted += name not in remaining
+    return deleted, remaining
@@ -0,0 +1,54 @@
+"""Rate-limited streaming of live tool output to the ACP client."""
+import asyncio
+import sys
+from typing import Awaitable, Callable, Optional
+
+# Minimum time between two progress updates for the same tool call (seconds)
+PROGRESS_INTERVAL = 0.3
+
+# Number of trailing characters of the output shown while the tool runs
+PROGRESS_TAIL_CHARS = 4000
+
+
+class ToolOutputStreamer:
+    """Batches tool output and sends it as periodic progress updates.
+
+    Output written between two updates is coalesced, so a fast-scrolling
+    command produces at most one update per interval. ACP progress content
+    replaces the previous content, so each update carries the tail of the
+    output accumulated so far.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 interval: float = PROGRESS_INTERVAL,
+                 tail_chars: int = PROGRESS_TAIL_CHARS):
+        self._send = send
+        self._interval = interval
+        self._tail_chars = tail_chars
+        self._tail = ""
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def write(self, text: str) -> None:
+        """Record new output and schedule an update if none is pending."""
+        self._tail = (self._tail + text)[-self._tail_chars:]
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def close(self) -> None:
+        """Stop scheduling updates. The caller sends the final result."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        self._flush_task = None
+        self._dirty = False
+
+    async def _flush_later(self) -> None:
+        # Keep sending while output arrives, at most once per interval
+        while self._dirty:
+            await asyncio.sleep(self._interval)
+            self._dirty = False
+            try:
+                await self._send(self._tail)
+            except Exception as e:
+                print(f"Failed to send tool progress: {e}", file=sys.stderr)
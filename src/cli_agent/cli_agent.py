@@ -1,72 +1,111 @@
+import asyncio
 import os
 
 from src.mcp.mcp_tools import cleanup_mcp_connections
-from src.model import create_model, load_system_prompt
-from src.utils.prompt_compaction import compact_messages_if_needed
+from src.model import format_token_usage, get_model_with_tools, \
+    load_system_prompt
+from src.utils.prompt_compaction import OVERFLOW_RETRY_THRESHOLD, \
+    BackgroundCompactor, compact_messages_if_needed, is_context_overflow_error
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, \
     SystemMessage, BaseMessage
 from langchain_core.tools.base import BaseTool
 
-from src.tools.tool import execute_tool, get_all_tools
+from src.tools.artifact_store import ArtifactStore, use_artifact_store
+from src.tools.tool import get_all_tools, get_tool_registry
+from src.tools.tool_executor import execute_tool_calls
+from src.tools.tool_selection import ToolSelector
 
 
 async def run_cli_agent():
     """Run the main agent loop."""
     system_prompt = load_system_prompt()
-    # Initialize the model and tools
-    tools: list[BaseTool] = await get_all_tools()
-    model = create_model().bind_tools(tools)
+    # Start the MCP servers; the agent is ready without waiting for them
+    await get_all_tools()
 
     # Add system prompt as the first message
     messages: list[BaseMessage] = [SystemMessage(content=system_prompt)]
+    compactor = BackgroundCompactor()
+    artifacts = ArtifactStore()
+    tool_selector = ToolSelector()
 
     print("Agent ready. Type 'quit' to exit.")
 
-    try:
-        while True:
-            # Get user input
-            print(f"{"---" * 20}")
-            user_input = input("[You]: ").strip()
+    # Tool calls of this session read its artifacts
+    with use_artifact_store(artifacts):
+        try:
+            while True:
+                # Get user input
+                print(f"{"---" * 20}")
+                # Read input in a thread so MCP servers keep connecting meanwhile
+                user_input = (await asyncio.to_thread(input, "[You]: ")).strip()
 
-            # Check for exit condition
-            if user_input.lower() == "quit":
-                print("Goodbye!")
-                break
+                # Check for exit condition
+                if user_input.lower() == "quit":
+                    print("Goodbye!")
+                    break
 
-            if not user_input:
-                continue
+                if not user_input:
+                    continue
 
-            # Append the user message to history
-            messages.append(HumanMessage(content=user_input))
+                # Append the user message to history
+                messages.append(HumanMessage(content=user_input))
+                tool_selector.start_turn(user_input)
 
-            while True:
-                response: AIMessage = await model.ainvoke(messages)
-                messages.append(response)
+                while True:
+                    # Servers that finished connecting contribute their tools
+                    all_tools: list[BaseTool] = await get_all_tools()
+                    tools = get_tool_registry(tool_selector.get_tools(all_tools))
+                    # Bind only the tools relevant to this turn
+                    model = get_model_with_tools(
+                        tool_selector.select(all_tools, messages))
 
-                # Check if we need to compact messages based on input token usage
-                input_tokens = response.usage_metadata.get("input_tokens", 0) if response.usage_metadata else 0
-                messages = await compact_messages_if_needed(
-                    messages=messages,
-                    current_input_tokens=input_tokens
-                )
-                # Check if there are tool calls to handle
-                if response.tool_calls:
-                    # print the thinking blocks
-                    _print_agent_text_output(response)
-                    # Execute each tool call
-                    for tool_call in response.tool_calls:
-                        result = await execute_tool(tools, tool_call)
-                        tool_message = ToolMessage(
-                            content=result,
-                            tool_call_id=tool_call["id"],
+                    # Turn boundary: swap in background compaction, or compact
+                    # before sending if the projected request is too large
+                    messages = await compactor.before_request(messages)
+                    try:
+                        response: AIMessage = await model.ainvoke(messages)
+                    except Exception as e:
+                        if not is_context_overflow_error(e):
+                            raise
+                        # Provider rejected the request as too long - compact and retry
+                        print(f"Context overflow, compacting and retrying: {e}")
+                        messages = await compact_messages_if_needed(
+                            messages=messages,
+                            current_input_tokens=0,
+                            threshold=OVERFLOW_RETRY_THRESHOLD,
+                            force=True
                         )
-                        messages.append(tool_message)
-                else:
-                    # No more tool calls - print the text response and break
-                    _print_agent_text_output(response)
-                    break
-    finally:
-        await cleanup_mcp_connections()
+                        response = await model.ainvoke(messages)
+                    messages.append(response)
+                    print(format_token_usage(response.usage_metadata))
+
+                    # Start background compaction (soft threshold) or compact now
+                    # (hard threshold) based on input token usage
+                    input_tokens = response.usage_metadata.get("input_tokens", 0) if response.usage_metadata else 0
+                    messages = await compactor.after_response(
+                        messages=messages,
+                        current_input_tokens=input_tokens
+                    )
+                    # Check if there are tool calls to handle
+                    if response.tool_calls:
+                        # print the thinking blocks
+                        _print_agent_text_output(response)
+                        # Execute the tool calls concurrently, keep history order
+                        results = await execute_tool_calls(tools, response.tool_calls)
+                        for tool_call, result in zip(response.tool_calls, results):
+                            tool_message = ToolMessage(
+                                # Oversized outputs are spilled to disk
+                                content=artifacts.spill(result, tool_call["name"]),
+                                tool_call_id=tool_call["id"],
+                            )
+                            messages.append(tool_message)
+                    else:
+                        # No more tool calls - print the text response and break
+                        _print_agent_text_output(response)
+                        break
+        finally:
+            artifacts.cleanup()
+            await cleanup_mcp_connections()
 
 
 def _print_agent_text_output(response: AIMessage):
@@ -1,5 +1,7 @@
 import argparse
 import asyncio
+import logging
+import os
 
 from dotenv import load_dotenv
 
@@ -10,6 +12,11 @@ from src.cli_agent.cli_agent import run_cli_agent
 def main():
     # Load environment variables
     load_dotenv(override=True)
+    # Logs go to stderr (stdout carries the ACP protocol); DEBUG logs every tool call
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
 
     # Check if should run in ACP mode
     parser = argparse.ArgumentParser(description="Coding Agent")
@@ -1,82 +1,366 @@
-"""MCP client connection management."""
+"""MCP client connection management.
+
+Connections are supervised: every server is pinged periodically, and a
+connection found dead (crashed stdio server, expired remote session, broken
+HTTP connection) is reopened with exponential backoff behind a stable
+session handle, so tools keep working without restarting the agent. Remote
+servers share one pooled HTTP transport.
+"""
+import asyncio
+import sys
+import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Awaitable, Callable, Optional
 
+import anyio
 import httpx
-from mcp import ClientSession
+from mcp import ClientSession, McpError
 from mcp.client.stdio import StdioServerParameters, stdio_client
 from mcp.client.streamable_http import streamable_http_client
+from mcp.types import CONNECTION_CLOSED
 from contextlib import AsyncExitStack
 from src.mcp.config import McpServerConfig
 
+# Maximum time to wait for a single MCP server to connect and initialize (seconds)
+MCP_CONNECT_TIMEOUT = 30.0
+
+# Interval between health-check pings of each connection (seconds)
+MCP_HEALTH_CHECK_INTERVAL = 30.0
+
+# Time a health-check ping may take before the connection is considered dead (seconds)
+MCP_PING_TIMEOUT = 10.0
+
+# Reconnect attempts after a connection died, and the initial backoff between
+# them (doubled after every failed attempt, up to the maximum; seconds)
+MCP_RECONNECT_ATTEMPTS = 5
+MCP_RECONNECT_BACKOFF = 0.5
+MCP_RECONNECT_MAX_BACKOFF = 30.0
+
+# Connection pool of the HTTP transport shared by all remote servers
+MCP_HTTP_MAX_CONNECTIONS = 100
+MCP_HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+MCP_HTTP_KEEPALIVE_EXPIRY = 60.0
+
+# Maximum concurrent requests per server (httpx has no per-host limit, and
+# every remote server is one host)
+MCP_MAX_REQUESTS_PER_SERVER = 8
+
+# Error code of the streamable HTTP transport when the server dropped the session
+_SESSION_TERMINATED = 32600
+
+
+@dataclass
+class McpServerMetrics:
+    """Connection and call statistics of one MCP server."""
+    connected: bool = False
+    connects: int = 0
+    reconnects: int = 0
+    connect_failures: int = 0
+    connect_latency: float = 0.0  # Seconds, of the latest successful connect
+    calls: int = 0
+    call_errors: int = 0
+    retries: int = 0
+    call_seconds: float = 0.0
+    last_error: str = ""
+
+    @property
+    def average_call_latency(self) -> float:
+        return self.call_seconds / self.calls if self.calls else 0.0
+
 
 @dataclass
 class McpConnection:
     """Active MCP server connection."""
     name: str
-    session: ClientSession
+    session: "SupervisedSession"
+    connect_latency: float = 0.0  # Seconds from start to initialized session
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """Whether a request failed because the connection itself is gone."""
+    if isinstance(error, McpError):
+        return error.error.code in (CONNECTION_CLOSED, _SESSION_TERMINATED)
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError,
+                              anyio.EndOfStream, httpx.TransportError,
+                              ConnectionError))
+
+
+def _was_not_sent(error: BaseException) -> bool:
+    """Whether a request failed before it was written to the transport."""
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError))
+
+
+class SupervisedSession:
+    """Session handle that stays valid across reconnects of its server.
+
+    Provides the ClientSession methods used by the tool adapters and sends
+    them to the current underlying session. When a request fails because the
+    connection died, the server is reconnected and the request is retried
+    once if repeating it is safe: the request was never sent, or it lists
+    tools, pings, or calls a tool the server annotates as idempotent or
+    read-only.
+    """
+
+    def __init__(self, manager: "McpClientManager", config: McpServerConfig,
+                 session: ClientSession, task: asyncio.Task):
+        self.config = config
+        self.metrics = manager.get_metrics(config.name)
+        self._manager = manager
+        self._session = session
+        self._task = task
+        self._generation = 0  # Incremented on every reconnect
+        self._reconnect_lock = asyncio.Lock()
+        self._request_limit = asyncio.Semaphore(MCP_MAX_REQUESTS_PER_SERVER)
+        self._idempotent_tools: set[str] = set()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the task owning the underlying connection is running."""
+        return not self._task.done()
+
+    async def list_tools(self, cursor: Optional[str] = None, **kwargs):
+        result = await self._request("list_tools", True, cursor=cursor, **kwargs)
+        for tool in result.tools:
+            annotations = tool.annotations
+            if annotations and (annotations.idempotentHint or annotations.readOnlyHint):
+                self._idempotent_tools.add(tool.name)
+        return result
+
+    async def call_tool(self, name: str, arguments: Optional[dict[str, Any]] = None,
+                        *args, **kwargs):
+        return await self._request("call_tool", name in self._idempotent_tools,
+                                   name, arguments, *args, **kwargs)
+
+    async def send_ping(self):
+        return await self._request("send_ping", True)
+
+    async def _request(self, method: str, idempotent: bool, *args, **kwargs):
+        """Send a request, reconnecting (and retrying once) if the connection died."""
+        async with self._request_limit:
+            generation = self._generation
+            if not self.alive:
+                # Died while idle; nothing was sent yet, so any request may go
+                await self.reconnect(generation)
+                generation = self._generation
+
+            started = time.perf_counter()
+            try:
+                return await getattr(self._session, method)(*args, **kwargs)
+            except Exception as e:
+                self.metrics.call_errors += 1
+                self.metrics.last_error = str(e) or type(e).__name__
+                if not _is_connection_error(e):
+                    raise
+                print(f"MCP server '{self.config.name}' connection lost during "
+                      f"{method}: {self.metrics.last_error}", file=sys.stderr)
+                await self.reconnect(generation)
+                if not (idempotent or _was_not_sent(e)):
+                    raise
+                self.metrics.retries += 1
+                return await getattr(self._session, method)(*args, **kwargs)
+            finally:
+                self.metrics.calls += 1
+                self.metrics.call_seconds += time.perf_counter() - started
+
+    async def check_health(self) -> bool:
+        """Ping the server and reconnect if it does not answer.
+
+        Returns:
+            True if the connection is (again) usable.
+        """
+        if self._reconnect_lock.locked():
+            return True
+        generation = self._generation
+        try:
+            if self.alive:
+                await asyncio.wait_for(self._session.send_ping(), MCP_PING_TIMEOUT)
+                return True
+            reason = "connection closed"
+        except Exception as e:
+            reason = str(e) or type(e).__name__
+        print(f"MCP server '{self.config.name}' failed health check: {reason}",
+              file=sys.stderr)
+        try:
+            await self.reconnect(generation)
+        except ConnectionError:
+            return False
+        return True
+
+    async def reconnect(self, generation: int) -> None:
+        """Replace the connection seen at `generation` with a new one.
+
+        Concurrent callers that saw the same dead connection reconnect only
+        once.
+
+        Raises:
+            ConnectionError: If every reconnect attempt failed.
+        """
+        async with self._reconnect_lock:
+            if generation != self._generation and self.alive:
+                return
+            self.metrics.connected = False
+            self._task.cancel()
+
+            backoff = MCP_RECONNECT_BACKOFF
+            for attempt in range(1, MCP_RECONNECT_ATTEMPTS + 1):
+                try:
+                    session, task, latency = await self._manager.open(self.config)
+                except Exception as e:
+                    self.metrics.connect_failures += 1
+                    self.metrics.last_error = str(e) or type(e).__name__
+                    print(f"Reconnect {attempt}/{MCP_RECONNECT_ATTEMPTS} to MCP "
+                          f"server '{self.config.name}' failed: {self.metrics.last_error}",
+                          file=sys.stderr)
+                    if attempt == MCP_RECONNECT_ATTEMPTS:
+                        raise ConnectionError(
+                            f"MCP server '{self.config.name}' is unavailable: "
+                            f"{self.metrics.last_error}") from e
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, MCP_RECONNECT_MAX_BACKOFF)
+                    continue
+
+                self._session, self._task = session, task
+                self._generation += 1
+                self.metrics.connected = True
+                self.metrics.reconnects += 1
+                self.metrics.connect_latency = latency
+                print(f"Reconnected to MCP server: {self.config.name} ({latency:.2f}s)",
+                      file=sys.stderr)
+                return
 
 
 class McpClientManager:
-    """Manages connections to multiple MCP servers."""
+    """Manages and supervises connections to multiple MCP servers.
+
+    Each connection is owned by a dedicated task that enters the transport
+    and session contexts and keeps them open until it is cancelled. The
+    contexts are anyio-based and must be exited by the task that entered
+    them, which lets servers connect concurrently and be reconnected
+    individually.
+    """
 
     def __init__(self):
         self._connections: list[McpConnection] = []
-        self._exit_stacks: list = []
+        self._tasks: set[asyncio.Task] = set()
+        self._supervisor: Optional[asyncio.Task] = None
+        self._http_transport: Optional[httpx.AsyncHTTPTransport] = None
+        self.metrics: dict[str, McpServerMetrics] = {}  # Server name -> metrics
 
-    async def _connect(self, config: McpServerConfig) -> Optional[
+    def get_metrics(self, name: str) -> McpServerMetrics:
+        """Get the metrics of a server, creating them on first use."""
+        return self.metrics.setdefault(name, McpServerMetrics())
+
+    async def connect(self, config: McpServerConfig,
+                       timeout: float = MCP_CONNECT_TIMEOUT) -> Optional[
         McpConnection]:
-        """Connect to a single MCP server."""
+        """Connect to a single MCP server within a deadline."""
+        metrics = self.get_metrics(config.name)
         try:
-            if config.server_type == "stdio":
-                return await self._connect_stdio(config)
-            elif config.server_type == "remote":
-                return await self._connect_remote(config)
-            else:
-                print(f"Unknown server type: {config.server_type}")
-                return None
+            session, task, latency = await self.open(config, timeout)
         except Exception as e:
-            print(f"Failed to connect to MCP server '{config.name}': {e}")
+            metrics.connect_failures += 1
+            metrics.last_error = str(e) or type(e).__name__
+            print(f"Failed to connect to MCP server '{config.name}': "
+                  f"{metrics.last_error}", file=sys.stderr)
             return None
 
-    async def _connect_stdio(self, config: McpServerConfig) -> McpConnection:
+        metrics.connected = True
+        metrics.connects += 1
+        metrics.connect_latency = latency
+        connection = McpConnection(
+            name=config.name,
+            session=SupervisedSession(self, config, session, task),
+            connect_latency=latency,
+        )
+        self._connections.append(connection)
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self._supervise())
+        print(f"Connected to MCP server: {config.name} ({latency:.2f}s)", file=sys.stderr)
+        return connection
+
+    async def open(self, config: McpServerConfig,
+                   timeout: float = MCP_CONNECT_TIMEOUT
+                   ) -> tuple[ClientSession, asyncio.Task, float]:
+        """Start the task owning a new connection and wait until it is ready.
+
+        Returns:
+            (initialized session, owner task, connect latency in seconds)
+
+        Raises:
+            TimeoutError: If the server did not initialize within the deadline.
+        """
+        started = time.perf_counter()
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._run_connection(config, ready))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        try:
+            session = await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except asyncio.TimeoutError:
+            task.cancel()
+            raise TimeoutError(f"timed out after {timeout:.0f}s") from None
+        except BaseException:
+            task.cancel()
+            raise
+        return session, task, time.perf_counter() - started
+
+    async def _run_connection(self, config: McpServerConfig,
+                              ready: asyncio.Future):
+        """Open a connection and keep it alive until this task is cancelled."""
+        try:
+            async with AsyncExitStack() as stack:
+                if config.server_type == "stdio":
+                    session = await self._open_stdio(config, stack)
+                elif config.server_type == "remote":
+                    session = await self._open_remote(config, stack)
+                else:
+                    raise ValueError(f"Unknown server type: {config.server_type}")
+                ready.set_result(session)
+                # Keep the contexts open until disconnect or reconnect
+                await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+            raise
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                # The next request or health check reconnects
+                self.get_metrics(config.name).connected = False
+                print(f"MCP server '{config.name}' connection closed: {e}", file=sys.stderr)
+
+    async def _open_stdio(self, config: McpServerConfig,
+                          stack: AsyncExitStack) -> ClientSession:
         """Connect to a stdio-based MCP server."""
         server_params = StdioServerParameters(
             command=config.command,
             args=config.args or [],
             env=config.env,
         )
-
-        # AsyncExitStack - we need to keep connections alive beyond this
-        # function's scope (for the agent's lifetime), so we manually enter
-        # the context and store the stack for later cleanup in disconnect_all().
-        stack = AsyncExitStack()
-        await stack.__aenter__()
-        self._exit_stacks.append(stack)
-
         read, write = await stack.enter_async_context(
             stdio_client(server_params))
         session = await stack.enter_async_context(ClientSession(read, write))
         await session.initialize()
+        return session
 
-        connection = McpConnection(name=config.name, session=session)
-        self._connections.append(connection)
-
-        print(f"Connected to MCP server: {config.name}")
-        return connection
+    def _get_http_transport(self) -> httpx.AsyncHTTPTransport:
+        """Get the keep-alive connection pool shared by all remote servers."""
+        if self._http_transport is None:
+            self._http_transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=MCP_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=MCP_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=MCP_HTTP_KEEPALIVE_EXPIRY,
+            ))
+        return self._http_transport
 
-    async def _connect_remote(self, config: McpServerConfig) -> McpConnection:
+    async def _open_remote(self, config: McpServerConfig,
+                           stack: AsyncExitStack) -> ClientSession:
         """Connect to a remote MCP server via HTTP."""
-
-        # AsyncExitStack - we need to keep connections alive beyond this
-        # function's scope (for the agent's lifetime), so we manually enter
-        # the context and store the stack for later cleanup in disconnect_all().
-        stack = AsyncExitStack()
-        await stack.__aenter__()
-        self._exit_stacks.append(stack)
-
-        # Create httpx client with your custom headers/auth
+        # Per-server headers/auth on top of the shared pool. The client is
+        # not closed: closing it would close the shared transport.
         client = httpx.AsyncClient(
+            transport=self._get_http_transport(),
             headers=config.headers,
             timeout=httpx.Timeout(30.0, read=300.0),
         )
@@ -85,37 +369,75 @@ class McpClientManager:
         )
         session = await stack.enter_async_context(ClientSession(read, write))
         await session.initialize()
+        return session
 
-        connection = McpConnection(name=config.name, session=session)
-        self._connections.append(connection)
+    async def _supervise(self):
+        """Health-check all connections periodically."""
+        while True:
+            await asyncio.sleep(MCP_HEALTH_CHECK_INTERVAL)
+            await asyncio.gather(*(connection.session.check_health()
+                                   for connection in list(self._connections)))
 
-        print(f"Connected to remote MCP server: {config.name}")
-        return connection
+    async def connect_all(
+            self,
+            configs: list[McpServerConfig],
+            on_connected: Optional[
+                Callable[[McpConnection], Awaitable[None]]] = None,
+            timeout: float = MCP_CONNECT_TIMEOUT,
+    ) -> list[McpConnection]:
+        """Connect to all configured MCP servers concurrently.
 
-    async def connect_all(self, configs: list[McpServerConfig]) -> list[
-        McpConnection]:
-        """Connect to all configured MCP servers."""
-        connections = []
-        for config in configs:
-            connection = await self._connect(config)
-            if connection:
-                connections.append(connection)
-        return connections
+        Args:
+            configs: Servers to connect to.
+            on_connected: Awaited as soon as each server is ready, so its
+                tools can be registered without waiting for slower servers.
+            timeout: Per-server connect deadline in seconds.
+        """
+        async def connect(config: McpServerConfig) -> Optional[McpConnection]:
+            connection = await self.connect(config, timeout)
+            if connection and on_connected is not None:
+                await on_connected(connection)
+            return connection
+
+        connections = await asyncio.gather(*(connect(c) for c in configs))
+        return [connection for connection in connections if connection]
 
     def get_connections(self) -> list[McpConnection]:
         """Get all active connections."""
         return self._connections
 
+    def format_metrics(self) -> str:
+        """Summarize the connection and call metrics of every server."""
+        lines = []
+        for name, m in self.metrics.items():
+            lines.append(
+                f"{name}: {'up' if m.connected else 'down'}, "
+                f"{m.connects} connects ({m.connect_latency:.2f}s), "
+                f"{m.reconnects} reconnects, {m.connect_failures} connect failures, "
+                f"{m.calls} calls (avg {m.average_call_latency * 1000:.0f}ms), "
+                f"{m.call_errors} errors, {m.retries} retries")
+        return "\n".join(lines)
+
     async def disconnect_all(self):
         """Disconnect from all MCP servers."""
-        for stack in reversed(self._exit_stacks):
-            try:
-                await stack.__aexit__(None, None, None)
-            except Exception as e:
-                print(f"Error disconnecting: {e}")
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception) and not isinstance(
+                    result, asyncio.CancelledError):
+                print(f"Error disconnecting: {result}", file=sys.stderr)
 
+        if self._http_transport is not None:
+            await self._http_transport.aclose()
+            self._http_transport = None
+        for metrics in self.metrics.values():
+            metrics.connected = False
         self._connections.clear()
-        self._exit_stacks.clear()
+        self._tasks.clear()
 
 
 # Global client manager instance
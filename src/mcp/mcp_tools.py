@@ -1,28 +1,168 @@
-"""Convert MCP tools to LangChain tools."""
+"""Convert MCP tools to LangChain tools.
+
+Each server's tool list and schemas are cached on disk, keyed by a hash of
+its McpServerConfig. Servers with a cached tool list are not started at
+all: proxy tools are registered from the cache and the server is started
+on the first call of one of its tools, which also refreshes the cache.
+Servers without a cache entry connect in the background.
+"""
+import asyncio
+import dataclasses
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Optional
 
 from langchain_core.tools import StructuredTool
 from langchain_mcp_adapters.tools import load_mcp_tools
 
 from src.mcp.client import McpConnection, client_manager
-from src.mcp.config import load_mcp_configs
+from src.mcp.config import McpServerConfig, load_mcp_configs
 from langchain_core.tools.base import BaseTool
 
-async def get_mcp_tools() -> list[StructuredTool]:
-    """Get all tools from connected MCP servers as LangChain tools."""
-    print("Loading mcp tools...")
-    tools = []
+# Directory of the cached tool lists, one JSON file per server config
+MCP_SCHEMA_CACHE_DIR = Path.home() / ".code-buddy" / "mcp_tool_cache"
+
+# Tools of the MCP servers, in registration order (proxies for lazy servers)
+_loaded_tools: list[BaseTool] = []
+
+# Background task connecting to the servers without a cached tool list
+_startup_task: Optional[asyncio.Task] = None
+
+
+def _config_hash(config: McpServerConfig) -> str:
+    """Stable hash of a server config; any change invalidates its cache."""
+    data = json.dumps(dataclasses.asdict(config), sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_path(config: McpServerConfig) -> Path:
+    return MCP_SCHEMA_CACHE_DIR / f"{config.name}-{_config_hash(config)}.json"
+
+
+def _read_schema_cache(config: McpServerConfig) -> Optional[list[dict]]:
+    """Return the cached tool specs of a server, or None if not cached."""
+    try:
+        data = json.loads(_cache_path(config).read_text(encoding="utf-8"))
+        return data["tools"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_schema_cache(config: McpServerConfig, tools: list[BaseTool]) -> None:
+    """Cache the names, descriptions and argument schemas of a server's tools."""
+    if not tools:
+        # Listing failed (or the server has no tools): keep starting it eagerly
+        return
+    specs = [{
+        "name": tool.name,
+        "description": tool.description,
+        "args_schema": tool.args_schema if isinstance(tool.args_schema, dict)
+        else tool.get_input_schema().model_json_schema(),
+    } for tool in tools]
+    path = _cache_path(config)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"cached_at": time.time(), "tools": specs}),
+                             encoding="utf-8")
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Failed to cache tools of MCP server '{config.name}': {e}",
+              file=sys.stderr)
+
+
+class _LazyServer:
+    """An MCP server that is started on the first call of one of its tools."""
+
+    def __init__(self, config: McpServerConfig, cached_names: set[str]):
+        self.config = config
+        self._cached_names = cached_names
+        self._tools: Optional[dict[str, BaseTool]] = None
+        self._lock = asyncio.Lock()
+
+    async def get_tool(self, name: str) -> Optional[BaseTool]:
+        """Return the real tool, starting the server if needed.
+
+        Raises:
+            RuntimeError: If the server cannot be started.
+        """
+        async with self._lock:
+            if self._tools is None:
+                print(f"Starting MCP server '{self.config.name}' on first use",
+                      file=sys.stderr)
+                connection = await client_manager.connect(self.config)
+                if connection is None:
+                    raise RuntimeError(
+                        f"MCP server '{self.config.name}' is not available")
+                tools = await _get_tools_from_connection(connection)
+                _write_schema_cache(self.config, tools)
+                self._tools = {tool.name: tool for tool in tools}
+                # Tools the server added since the cache was written
+                _loaded_tools.extend(tool for tool in tools
+                                     if tool.name not in self._cached_names)
+        return self._tools.get(name)
+
+
+def _proxy_tool(server: _LazyServer, spec: dict) -> BaseTool:
+    """Create a tool from a cached spec that forwards to the real tool."""
+    async def call(**kwargs):
+        tool = await server.get_tool(spec["name"])
+        if tool is None:
+            return (f"Error: MCP server '{server.config.name}' no longer "
+                    f"provides the tool '{spec['name']}'")
+        return await tool.ainvoke(kwargs)
+
+    return StructuredTool(
+        name=spec["name"],
+        description=spec["description"],
+        args_schema=spec["args_schema"],
+        coroutine=call,
+        metadata={"mcp_server": server.config.name},
+    )
+
+
+def start_mcp_servers() -> None:
+    """Register the MCP tools, starting servers only where needed.
+
+    Servers with a cached tool list get proxy tools immediately. The others
+    connect concurrently in the background; each server's tools are
+    registered as soon as it is ready (see get_loaded_mcp_tools).
+    """
+    global _startup_task
+    if _startup_task is not None:
+        return
+    print("Loading mcp tools...", file=sys.stderr)
+    uncached = []
+    for config in load_mcp_configs():
+        specs = _read_schema_cache(config)
+        if specs is None:
+            uncached.append(config)
+            continue
+        server = _LazyServer(config, {spec["name"] for spec in specs})
+        _loaded_tools.extend(_proxy_tool(server, spec) for spec in specs)
+        print(f"Registered {len(specs)} cached tools from MCP server "
+              f"'{config.name}' (starts on first use)", file=sys.stderr)
+
+    configs = {config.name: config for config in uncached}
 
-    # Load configs and connect to servers
-    configs = load_mcp_configs()
+    async def register(connection: McpConnection) -> None:
+        tools = await _get_tools_from_connection(connection)
+        _write_schema_cache(configs[connection.name], tools)
+        _loaded_tools.extend(tools)
+        print(f"Registered {len(tools)} tools from MCP server '{connection.name}'",
+              file=sys.stderr)
 
-    await client_manager.connect_all(configs)
+    _startup_task = asyncio.create_task(
+        client_manager.connect_all(uncached, on_connected=register))
 
-    # Get tools from each connection
-    for connection in client_manager.get_connections():
-        connection_tools = await _get_tools_from_connection(connection)
-        tools.extend(connection_tools)
 
-    return tools
+def get_loaded_mcp_tools() -> list[BaseTool]:
+    """Get the tools of the MCP servers registered so far."""
+    return list(_loaded_tools)
 
 
 async def _get_tools_from_connection(connection: McpConnection) -> list[BaseTool]:
@@ -34,14 +174,27 @@ async def _get_tools_from_connection(connection: McpConnection) -> list[BaseTool
         # Prefix tool names with connection name to avoid collisions
         for tool in tools:
             tool.name = f"{connection.name}_{tool.name}"
+            tool.metadata = {**(tool.metadata or {}), "mcp_server": connection.name}
 
         return tools
 
     except Exception as e:
-        print(f"Error getting tools from '{connection.name}': {e}")
+        print(f"Error getting tools from '{connection.name}': {e}", file=sys.stderr)
         return []
 
 
 async def cleanup_mcp_connections():
     """Cleanup all MCP connections."""
+    global _startup_task
+    if _startup_task is not None:
+        _startup_task.cancel()
+        try:
+            await _startup_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _startup_task = None
+    metrics = client_manager.format_metrics()
+    if metrics:
+        print(f"MCP server metrics:\n{metrics}", file=sys.stderr)
     await client_manager.disconnect_all()
+    _loaded_tools.clear()
@@ -1,14 +1,176 @@
 """Shared model and prompt utilities."""
 import os
+from collections import OrderedDict
 from pathlib import Path
+from typing import Sequence
 
 from langchain_anthropic import ChatAnthropic
+from langchain_anthropic.chat_models import convert_to_anthropic_tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.tools.base import BaseTool
+
+# Environment variables that affect the model client configuration
+_MODEL_ENV_VARS = (
+    "AI_PROVIDER",
+    "GEMINI_MODEL",
+    "GOOGLE_API_KEY",
+    "GEMINI_BASE_URL",
+    "CLAUDE_MODEL",
+    "ANTHROPIC_API_KEY",
+    "ANTHROPIC_BASE_URL",
+)
+
+# Maximum number of tool-bound models kept in the registry
+MAX_BOUND_MODELS = 32
+
+# Anthropic prompt cache breakpoint marker
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Content block types Anthropic does not allow cache_control on
+_UNCACHEABLE_BLOCK_TYPES = {"thinking", "redacted_thinking", "reasoning"}
+
+# Process-wide model registry: {config_key: model}
+_models: dict[tuple, BaseChatModel] = {}
+# Tool-bound models: {(config_key, tool_set_key): runnable}, LRU ordered
+_bound_models: OrderedDict[tuple, Runnable] = OrderedDict()
+
+
+def _model_config_key() -> tuple:
+    """Build the registry key from the current model configuration."""
+    return tuple(os.getenv(name) for name in _MODEL_ENV_VARS)
+
+
+def get_model() -> BaseChatModel:
+    """Return the shared chat model for the current configuration.
+
+    The model (and its HTTP client with its keep-alive connection pool) is
+    created once per provider/config and reused by every session and turn.
+    """
+    key = _model_config_key()
+    model = _models.get(key)
+    if model is None:
+        model = create_model()
+        _models[key] = model
+    return model
+
+
+def get_model_with_tools(tools: Sequence[BaseTool]) -> Runnable:
+    """Return the shared chat model with the given tools bound.
+
+    The bind_tools result is cached per tool set so hot turns do no client
+    or schema setup at all.
+    """
+    key = (_model_config_key(), tuple((tool.name, id(tool)) for tool in tools))
+    bound_model = _bound_models.get(key)
+    if bound_model is None:
+        model = get_model()
+        if isinstance(model, ChatAnthropic):
+            # Cache the tool schemas and the message prefix on every request
+            bound_model = (
+                RunnableLambda(add_cache_breakpoints, name="add_cache_breakpoints")
+                | model.bind_tools(_cached_anthropic_tools(tools))
+            )
+        else:
+            bound_model = model.bind_tools(list(tools))
+        _bound_models[key] = bound_model
+        if len(_bound_models) > MAX_BOUND_MODELS:
+            _bound_models.popitem(last=False)
+    else:
+        _bound_models.move_to_end(key)
+    return bound_model
+
+
+def _cached_anthropic_tools(tools: Sequence[BaseTool]) -> list[dict]:
+    """Convert tools to Anthropic schemas with a cache breakpoint on the last one."""
+    anthropic_tools = [dict(convert_to_anthropic_tool(tool)) for tool in tools]
+    if anthropic_tools:
+        anthropic_tools[-1]["cache_control"] = CACHE_CONTROL
+    return anthropic_tools
+
+
+def _with_cache_control(message: BaseMessage) -> BaseMessage:
+    """Return a copy of the message with cache_control on its last cacheable block."""
+    content = message.content
+    if isinstance(content, str):
+        if not content:
+            return message
+        blocks = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+        return message.model_copy(update={"content": blocks})
+
+    blocks = list(content)
+    for index in range(len(blocks) - 1, -1, -1):
+        block = blocks[index]
+        if isinstance(block, str):
+            block = {"type": "text", "text": block}
+        if not isinstance(block, dict) or block.get("type") in _UNCACHEABLE_BLOCK_TYPES:
+            continue
+        if block.get("type") == "text" and not block.get("text"):
+            continue
+        blocks[index] = {**block, "cache_control": CACHE_CONTROL}
+        return message.model_copy(update={"content": blocks})
+    return message
+
+
+def add_cache_breakpoints(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Add Anthropic prompt cache breakpoints to the request messages.
+
+    Together with the breakpoint on the tool definitions this uses all four
+    breakpoints Anthropic allows:
+    - the system prompt (stable for the whole session)
+    - the last message, so the next turn reads the whole prefix from cache
+    - the last message of the previous request (the one before the newest
+      AI message), so a turn that appended many tool results still hits
+      the prefix written by the previous request. AI messages cannot carry
+      the breakpoint: langchain_anthropic rebuilds their tool_use blocks
+      from tool_calls and drops cache_control.
+
+    The history itself is never modified; marked messages are copies.
+    """
+    marked = list(messages)
+    if not marked:
+        return marked
+
+    breakpoints = {len(marked) - 1}
+    if isinstance(marked[0], SystemMessage):
+        breakpoints.add(0)
+    for index in range(len(marked) - 2, 0, -1):
+        if marked[index].type == "ai":
+            previous = index - 1
+            while previous > 0 and marked[previous].type == "ai":
+                previous -= 1
+            breakpoints.add(previous)
+            break
+
+    for index in breakpoints:
+        marked[index] = _with_cache_control(marked[index])
+    return marked
+
+
+def format_token_usage(usage_metadata: dict | None) -> str:
+    """Format token usage, including prompt cache reads and writes."""
+    if not usage_metadata:
+        return "Token usage: unavailable"
+    details = usage_metadata.get("input_token_details") or {}
+    input_tokens = usage_metadata.get("input_tokens", 0)
+    cache_read = details.get("cache_read") or 0
+    cache_write = details.get("cache_creation") or 0
+    hit_rate = cache_read / input_tokens if input_tokens else 0.0
+    return (
+        f"Token usage: input={input_tokens}, "
+        f"output={usage_metadata.get('output_tokens', 0)}, "
+        f"cache_read={cache_read}, cache_write={cache_write}, "
+        f"cache_hit_rate={hit_rate:.1%}"
+    )
 
 
 def create_model() -> BaseChatModel:
-    """Create and return the LangChain chat model based on AI_PROVIDER env."""
+    """Create and return a new LangChain chat model based on AI_PROVIDER env.
+
+    Prefer get_model(), which reuses the client across calls.
+    """
     provider = os.getenv("AI_PROVIDER", "anthropic").lower()
 
     if provider == "gemini":
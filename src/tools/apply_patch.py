@@ -0,0 +1,467 @@
+"""Apply multi-file unified diffs in a single tool call.
+
+Hunks are located with fuzzy context matching (line offset, whitespace
+differences, trimmed outer context lines). Files are patched in parallel in
+memory; only when every hunk of every file applies are the results written,
+and a failed write rolls back the files already written.
+"""
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Annotated, Optional
+
+from langchain_core.tools import tool
+
+from src.tools.file_cache import file_cache
+from src.tools.workspace import get_workspace_root
+
+# Maximum number of files patched (and written) in parallel
+PATCH_WORKERS = 8
+
+# Maximum number of outer context lines dropped when a hunk does not match
+MAX_CONTEXT_FUZZ = 2
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_DEV_NULL = "/dev/null"
+
+
+class PatchError(Exception):
+    """The patch is malformed or does not apply."""
+
+
+class RollbackError(Exception):
+    """Writing the patch failed and some files could not be restored."""
+
+    def __init__(self, error: OSError, failures: list[str]):
+        super().__init__(f"{error}; could not restore: {'; '.join(failures)}")
+        self.error = error
+        self.failures = failures
+
+
+@dataclass
+class Hunk:
+    """A hunk of a unified diff. Lines keep their ' ', '-' or '+' prefix."""
+    header: str
+    old_start: int
+    lines: list[str] = field(default_factory=list)
+    old_no_newline: bool = False  # "\ No newline at end of file" after old content
+    new_no_newline: bool = False  # "\ No newline at end of file" after new content
+
+    @property
+    def old_lines(self) -> list[str]:
+        return [line[1:] for line in self.lines if line[0] in " -"]
+
+    @property
+    def new_lines(self) -> list[str]:
+        return [line[1:] for line in self.lines if line[0] in " +"]
+
+
+@dataclass
+class FilePatch:
+    """Changes of one file. old_path is None for new files, new_path for deletions."""
+    old_path: Optional[str]
+    new_path: Optional[str]
+    hunks: list[Hunk] = field(default_factory=list)
+
+    @property
+    def display_path(self) -> str:
+        if self.old_path and self.new_path and self.old_path != self.new_path:
+            return f"{self.old_path} -> {self.new_path}"
+        return self.new_path or self.old_path or "?"
+
+    @property
+    def status(self) -> str:
+        if self.old_path is None:
+            return "A"
+        if self.new_path is None:
+            return "D"
+        return "R" if self.old_path != self.new_path else "M"
+
+
+@dataclass
+class _PlannedFile:
+    """In-memory result of patching one file."""
+    patch: FilePatch
+    report: list[str]
+    new_content: Optional[bytes] = None  # None when the file is deleted
+    error: Optional[str] = None
+
+
+def _strip_path(raw: str) -> Optional[str]:
+    """Normalize a ---/+++ path: drop timestamps and the a/ b/ prefixes."""
+    path = raw.split("\t")[0].strip()
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1]
+    if path == _DEV_NULL:
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def parse_patch(patch: str) -> list[FilePatch]:
+    """Parse a (git or plain) unified diff.
+
+    Hunk line counts are used when present, but hunks also end at the next
+    file or hunk header, which tolerates miscounted hand-written diffs.
+
+    Raises:
+        PatchError: If the patch contains no file changes or is malformed.
+    """
+    lines = [line.rstrip("\r") for line in patch.splitlines()]
+    files: list[FilePatch] = []
+    current: Optional[FilePatch] = None
+    rename_from = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("diff --git "):
+            current = None
+            rename_from = None
+            i += 1
+        elif line.startswith("rename from "):
+            rename_from = line[len("rename from "):]
+            i += 1
+        elif line.startswith("rename to ") and rename_from is not None:
+            # Pure rename without content changes (no ---/+++ lines follow)
+            current = FilePatch(rename_from, line[len("rename to "):])
+            files.append(current)
+            i += 1
+        elif line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            old_path = _strip_path(line[4:])
+            new_path = _strip_path(lines[i + 1][4:])
+            if old_path is None and new_path is None:
+                raise PatchError(f"Invalid file header at line {i + 1}: both paths are {_DEV_NULL}")
+            if current is not None and rename_from is not None and not current.hunks:
+                # The hunks belong to the rename declared in the git header
+                current.old_path, current.new_path = old_path, new_path
+            else:
+                current = FilePatch(old_path, new_path)
+                files.append(current)
+            rename_from = None
+            i += 2
+        elif line.startswith("@@"):
+            if current is None:
+                raise PatchError(f"Hunk without file header at line {i + 1}")
+            i = _parse_hunk(lines, i, current)
+        else:
+            # git metadata (index, mode lines) and free text
+            i += 1
+    if not files:
+        raise PatchError("No file changes found (expected ---/+++ headers and @@ hunks)")
+    return files
+
+
+def _parse_hunk(lines: list[str], i: int, file_patch: FilePatch) -> int:
+    """Parse the hunk starting at lines[i] and return the index after it."""
+    header = lines[i]
+    match = _HUNK_HEADER.match(header)
+    if match:
+        old_start = int(match.group(1))
+        old_remaining = int(match.group(2)) if match.group(2) is not None else 1
+        new_remaining = int(match.group(4)) if match.group(4) is not None else 1
+    else:
+        # "@@ ... @@" without line numbers: locate by context only
+        old_start, old_remaining, new_remaining = 0, None, None
+    hunk = Hunk(header=header.split("@@", 2)[1].strip() if header.count("@@") >= 2 else header,
+                old_start=old_start)
+    i += 1
+    while i < len(lines):
+        line = lines[i]
+        counted = old_remaining is not None
+        if counted and old_remaining <= 0 and new_remaining <= 0:
+            if not line.startswith("\\"):
+                break
+        if line.startswith("\\"):
+            if hunk.lines:
+                if hunk.lines[-1][0] in " -":
+                    hunk.old_no_newline = True
+                if hunk.lines[-1][0] in " +":
+                    hunk.new_no_newline = True
+            i += 1
+            continue
+        if line.startswith(("@@", "diff --git ")):
+            break
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            break
+        if line == "":
+            # Blank context line whose leading space was stripped
+            line = " "
+        if line[0] not in " -+":
+            break
+        hunk.lines.append(line)
+        if counted:
+            if line[0] in " -":
+                old_remaining -= 1
+            if line[0] in " +":
+                new_remaining -= 1
+        i += 1
+    if not hunk.lines:
+        raise PatchError(f"Empty hunk '{header}'")
+    file_patch.hunks.append(hunk)
+    return i
+
+
+def _normalize_whitespace(line: str) -> str:
+    return " ".join(line.split())
+
+
+def _find_block(lines: list[str], block: list[str], expected: int, lowest: int,
+                normalize) -> Optional[int]:
+    """Find the position of block in lines closest to expected, at or after lowest."""
+    if not block:
+        return min(max(expected, lowest), len(lines))
+    target = [normalize(line) for line in block]
+    first = target[0]
+    best = None
+    for position in range(lowest, len(lines) - len(block) + 1):
+        # Later positions can no longer be closer to the expected line
+        if best is not None and position - expected >= abs(best - expected):
+            break
+        if normalize(lines[position]) != first:
+            continue
+        if all(normalize(lines[position + k]) == target[k] for k in range(1, len(block))):
+            best = position
+    return best
+
+
+def _locate_hunk(lines: list[str], hunk: Hunk, expected: int,
+                 lowest: int) -> tuple[int, list[str], list[str], str]:
+    """Find where a hunk applies.
+
+    Returns:
+        (position, old_block, new_block, fuzz description) where old_block is
+        the part of the hunk that matched (outer context may be trimmed).
+
+    Raises:
+        PatchError: If the hunk cannot be located.
+    """
+    hunk_lines = hunk.lines
+    tried = set()
+    for fuzz in range(MAX_CONTEXT_FUZZ + 1):
+        # Drop up to `fuzz` context lines at each end of the hunk
+        leading = 0
+        while leading < fuzz and leading < len(hunk_lines) and hunk_lines[leading][0] == " ":
+            leading += 1
+        trailing = 0
+        while (trailing < fuzz and trailing < len(hunk_lines) - leading
+               and hunk_lines[len(hunk_lines) - 1 - trailing][0] == " "):
+            trailing += 1
+        if (leading, trailing) in tried:
+            # Nothing more to trim than at the previous fuzz level
+            continue
+        tried.add((leading, trailing))
+        trimmed = hunk_lines[leading:len(hunk_lines) - trailing]
+        old_block = [line[1:] for line in trimmed if line[0] in " -"]
+        new_block = [line[1:] for line in trimmed if line[0] in " +"]
+        for normalize, description in ((lambda line: line, ""),
+                                       (str.rstrip, "trailing whitespace"),
+                                       (_normalize_whitespace, "whitespace")):
+            position = _find_block(lines, old_block, expected + leading, lowest, normalize)
+            if position is not None:
+                notes = [note for note in (description, f"{fuzz} context line(s) trimmed" if fuzz else "") if note]
+                return position, old_block, new_block, ", ".join(notes)
+    raise PatchError(f"context not found (expected near line {expected + 1})")
+
+
+def _decode(data: bytes) -> tuple[list[str], str, bool]:
+    """Split file content into lines, its newline style and final-newline flag."""
+    text = data.decode("utf-8")
+    newline = "\r\n" if "\r\n" in text else "\n"
+    if newline == "\r\n":
+        text = text.replace("\r\n", "\n")
+    ends_with_newline = text.endswith("\n")
+    lines = text.split("\n")
+    if ends_with_newline or lines == [""]:
+        lines.pop()
+    return lines, newline, ends_with_newline
+
+
+def _encode(lines: list[str], newline: str, ends_with_newline: bool) -> bytes:
+    text = newline.join(lines)
+    if lines and ends_with_newline:
+        text += newline
+    return text.encode("utf-8")
+
+
+def _resolve(root: Path, path: str) -> Path:
+    """Resolve a patch path under the project root."""
+    resolved = (root / path).resolve()
+    root = root.resolve()
+    if resolved != root and root not in resolved.parents:
+        raise PatchError(f"path '{path}' is outside the project root")
+    return resolved
+
+
+def _plan_file(root: Path, file_patch: FilePatch) -> _PlannedFile:
+    """Apply a file's hunks in memory."""
+    planned = _PlannedFile(patch=file_patch, report=[])
+    try:
+        if file_patch.old_path is None:
+            if _resolve(root, file_patch.new_path).exists():
+                raise PatchError("file already exists")
+            lines, newline, ends_with_newline = [], "\n", True
+        else:
+            source = _resolve(root, file_patch.old_path)
+            if not source.is_file():
+                raise PatchError("file does not exist")
+            lines, newline, ends_with_newline = _decode(file_cache.read_bytes(source))
+            if file_patch.new_path is not None and file_patch.new_path != file_patch.old_path \
+                    and _resolve(root, file_patch.new_path).exists():
+                raise PatchError(f"rename target '{file_patch.new_path}' already exists")
+    except (PatchError, OSError, UnicodeDecodeError) as e:
+        planned.error = str(e)
+        return planned
+
+    offset = 0
+    lowest = 0
+    failed = False
+    for number, hunk in enumerate(file_patch.hunks, start=1):
+        label = f"  hunk {number} @@ {hunk.header} @@" if hunk.header else f"  hunk {number}"
+        if not hunk.old_start:
+            expected = lowest
+        elif hunk.old_lines:
+            expected = hunk.old_start - 1 + offset
+        else:
+            # Pure insertion: "-N,0" means after line N
+            expected = hunk.old_start + offset
+        try:
+            position, old_block, new_block, fuzz = _locate_hunk(lines, hunk, expected, lowest)
+        except PatchError as e:
+            planned.report.append(f"{label}: FAILED, {e}")
+            failed = True
+            continue
+        reaches_end = position + len(old_block) == len(lines)
+        lines[position:position + len(old_block)] = new_block
+        if reaches_end:
+            if hunk.new_no_newline:
+                ends_with_newline = False
+            elif hunk.old_no_newline:
+                ends_with_newline = True
+        shift = position - expected
+        offset += len(new_block) - len(old_block) + shift
+        lowest = position + len(new_block)
+        details = [f"offset {shift:+d}" if shift else "", f"fuzz: {fuzz}" if fuzz else ""]
+        details = ", ".join(detail for detail in details if detail)
+        planned.report.append(f"{label}: applied at line {position + 1}" + (f" ({details})" if details else ""))
+
+    if failed:
+        planned.error = "hunks failed"
+    elif file_patch.new_path is not None:
+        planned.new_content = _encode(lines, newline, ends_with_newline)
+    elif lines:
+        planned.error = "file is not empty after applying the deletion"
+    return planned
+
+
+def _commit(root: Path, plans: list[_PlannedFile], executor: ThreadPoolExecutor) -> None:
+    """Write all planned files; on failure restore every file already changed.
+
+    Raises:
+        OSError: If a write fails (after rolling back).
+        RollbackError: If a write fails and some files cannot be restored.
+    """
+    # Back up every path that will change: {path: original bytes or None}
+    backups: dict[Path, Optional[bytes]] = {}
+    for plan in plans:
+        for path in (plan.patch.old_path, plan.patch.new_path):
+            if path is not None:
+                resolved = _resolve(root, path)
+                backups[resolved] = file_cache.read_bytes(resolved) if resolved.is_file() else None
+
+    changed: list[Path] = []
+
+    def write(plan: _PlannedFile) -> list[Path]:
+        touched = []
+        patch = plan.patch
+        if patch.new_path is not None:
+            target = _resolve(root, patch.new_path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            touched.append(target)
+            file_cache.write_bytes(target, plan.new_content)
+        if patch.old_path is not None and patch.old_path != patch.new_path:
+            source = _resolve(root, patch.old_path)
+            touched.append(source)
+            source.unlink()
+            file_cache.invalidate(source)
+        return touched
+
+    futures = [executor.submit(write, plan) for plan in plans]
+    error = None
+    for future in futures:
+        try:
+            changed.extend(future.result())
+        except OSError as e:
+            error = error or e
+    if error is None:
+        return
+
+    # Roll back: restore originals and remove created files
+    rollback_failures = []
+    for path, original in backups.items():
+        try:
+            if original is None:
+                if path.exists():
+                    path.unlink()
+                file_cache.invalidate(path)
+            else:
+                file_cache.write_bytes(path, original)
+        except OSError as e:
+            print(f"Failed to roll back '{path}': {e}", file=sys.stderr)
+            rollback_failures.append(f"{path.relative_to(root.resolve())}: {e}")
+    if rollback_failures:
+        raise RollbackError(error, rollback_failures)
+    raise error
+
+
+@tool
+def apply_patch(
+        patch: Annotated[str, "Unified diff (e.g. `git diff` output) that may touch several files. "
+                              "Use /dev/null as the old path for new files and as the new path for deletions"],
+) -> str:
+    """Apply a multi-file unified diff in one call.
+
+    Hunks are matched with fuzzy context (shifted line numbers, whitespace
+    differences, trimmed outer context). Either every file is changed or none.
+
+    Returns:
+        Per-file, per-hunk report, or an error describing the failing hunks.
+    """
+    try:
+        file_patches = parse_patch(patch)
+    except PatchError as e:
+        return f"Error: {e}"
+
+    targets = [p.new_path or p.old_path for p in file_patches]
+    duplicates = sorted({t for t in targets if targets.count(t) > 1})
+    if duplicates:
+        return f"Error: the patch changes the same file more than once: {', '.join(duplicates)}"
+
+    with ThreadPoolExecutor(max_workers=min(PATCH_WORKERS, len(file_patches))) as executor:
+        # Worker threads do not inherit the session context, pass the root
+        root = get_workspace_root()
+        plans = list(executor.map(partial(_plan_file, root), file_patches))
+
+        report = []
+        for plan in plans:
+            line = f"{plan.patch.status} {plan.patch.display_path}"
+            report.append(line + (f": FAILED, {plan.error}" if plan.error and plan.error != "hunks failed" else ""))
+            report.extend(plan.report)
+
+        if any(plan.error for plan in plans):
+            return "Error: patch not applied, no files were changed.\n" + "\n".join(report)
+
+        try:
+            _commit(root, plans, executor)
+        except RollbackError as e:
+            return (f"Error: writing the patch failed ({e.error}) and rolling back failed too. "
+                    f"These files may be partially patched, check them before retrying:\n"
+                    + "\n".join(e.failures))
+        except (OSError, PatchError) as e:
+            return f"Error: writing the patch failed, all changes were rolled back: {e}"
+
+    hunk_count = sum(len(plan.patch.hunks) for plan in plans)
+    return (f"Applied patch: {len(plans)} file(s), {hunk_count} hunk(s)\n" + "\n".join(report))
@@ -0,0 +1,201 @@
+"""On-disk store for tool outputs too large to keep in the conversation.
+
+Each session has its own store directory under ARTIFACT_ROOT, which is
+private to the user (mode 0700). The history keeps a preview and an
+artifact ID; read_tool_artifact pages through the stored output. The store
+of the running session is kept in a context variable (like the workspace
+root), so a session can only read its own artifacts.
+"""
+import itertools
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Annotated, Collection, Iterator, Optional
+
+from langchain_core.tools import tool
+
+# Tool results larger than this (in bytes) are spilled to the artifact store
+ARTIFACT_THRESHOLD_BYTES = 20_000
+
+# Number of characters of the head and of the tail kept in history
+ARTIFACT_PREVIEW_CHARS = 2_000
+
+# Maximum size of a single page returned by read_tool_artifact
+MAX_ARTIFACT_PAGE_BYTES = 16_000
+
+# Root directory for all artifact stores (tool outputs may contain secrets)
+ARTIFACT_ROOT = Path.home() / ".code-buddy" / "artifacts"
+
+# Tools whose output is never spilled (paging an artifact must not create another)
+_NEVER_SPILLED_TOOLS = {"read_tool_artifact"}
+
+# Format of artifact IDs; validating it keeps lookups inside the store
+_ARTIFACT_ID = re.compile(r"art_[0-9a-f]{12}")
+
+
+class ArtifactStore:
+    """Per-session on-disk store for oversized tool outputs.
+
+    Large results are written to disk and replaced in the history by their
+    head, their tail and a handle that read_tool_artifact can page through.
+    """
+
+    def __init__(self, name: Optional[str] = None,
+                 threshold_bytes: int = ARTIFACT_THRESHOLD_BYTES,
+                 preview_chars: int = ARTIFACT_PREVIEW_CHARS):
+        self.directory = ARTIFACT_ROOT / (name or uuid.uuid4().hex[:12])
+        self.threshold_bytes = threshold_bytes
+        self.preview_chars = preview_chars
+
+    def spill(self, content: str, tool_name: str = "") -> str:
+        """Store content on disk if it is too large for the history.
+
+        Returns:
+            The content itself if it is small enough, otherwise its head,
+            tail and the artifact handle.
+        """
+        if tool_name in _NEVER_SPILLED_TOOLS:
+            return content
+
+        data = content.encode("utf-8", errors="replace")
+        if len(data) <= self.threshold_bytes:
+            return content
+
+        artifact_id = f"art_{uuid.uuid4().hex[:12]}"
+        if not self.directory.is_dir():
+            ARTIFACT_ROOT.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # Also restrict a root created by an older version
+            os.chmod(ARTIFACT_ROOT, 0o700)
+            self.directory.mkdir(mode=0o700, exist_ok=True)
+        path = self.directory / f"{artifact_id}.txt"
+        path.write_bytes(data)
+
+        total_lines = content.count("\n") + 1
+        head = content[:self.preview_chars]
+        tail = content[max(len(head), len(content) - self.preview_chars):]
+        omitted = len(content) - len(head) - len(tail)
+        return (
+            f"{head}\n"
+            f"... [{omitted} characters omitted] ...\n"
+            f"{tail}\n\n"
+            f"[Output too large ({len(data)} bytes, {total_lines} lines). "
+            f"Full output stored as artifact '{artifact_id}'. "
+            f"Use read_tool_artifact to page through it.]"
+        )
+
+    def cleanup(self):
+        """Delete every artifact of this store."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def prune_artifact_stores(max_age: float, keep: Collection[str] = ()) -> int:
+    """Delete the stores not written to for max_age seconds.
+
+    Args:
+        keep: Store names never deleted, e.g. those of sessions still on disk.
+
+    Returns:
+        The number of stores deleted.
+    """
+    try:
+        entries = list(os.scandir(ARTIFACT_ROOT))
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age
+    deleted = 0
+    for entry in entries:
+        if entry.name in keep or not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            # Spilling an artifact adds a file, which updates the directory mtime
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        deleted += 1
+    return deleted
+
+
+# Artifact store of the running session, set per prompt turn
+_current_store: ContextVar[Optional[ArtifactStore]] = ContextVar("artifact_store",
+                                                                 default=None)
+
+
+@contextmanager
+def use_artifact_store(store: ArtifactStore) -> Iterator[ArtifactStore]:
+    """Let the enclosed tool calls read the artifacts of a store."""
+    token = _current_store.set(store)
+    try:
+        yield store
+    finally:
+        _current_store.reset(token)
+
+
+def _find_artifact(artifact_id: str) -> Optional[Path]:
+    """Locate an artifact in the store of the current session.
+
+    The store directory is named after the session, so sessions restored
+    from their journal still find the artifacts written before a restart.
+    """
+    store = _current_store.get()
+    if store is None or not _ARTIFACT_ID.fullmatch(artifact_id):
+        return None
+    path = store.directory / f"{artifact_id}.txt"
+    return path if path.is_file() else None
+
+
+@tool
+def read_tool_artifact(
+    artifact_id: Annotated[str, "The artifact ID from a truncated tool output, e.g. 'art_1a2b3c4d5e6f'"],
+    start_line: Annotated[Optional[int], "First line to read (1-indexed). Use either lines or bytes"] = None,
+    end_line: Annotated[Optional[int], "Last line to read (1-indexed, inclusive)"] = None,
+    byte_offset: Annotated[Optional[int], "Byte offset to start reading from"] = None,
+    byte_length: Annotated[Optional[int], "Number of bytes to read from byte_offset"] = None,
+) -> str:
+    """Read a page of a tool output that was too large to keep in the conversation.
+
+    Returns:
+        The requested line or byte range of the stored output.
+    """
+    path = _find_artifact(artifact_id)
+    if path is None:
+        return f"Error: Artifact '{artifact_id}' not found"
+
+    total_bytes = path.stat().st_size
+
+    if byte_offset is not None or byte_length is not None:
+        offset = max(byte_offset or 0, 0)
+        length = min(byte_length or MAX_ARTIFACT_PAGE_BYTES, MAX_ARTIFACT_PAGE_BYTES)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        end = offset + len(data)
+        return (
+            f"[bytes {offset}-{end} of {total_bytes}]\n"
+            f"{data.decode('utf-8', errors='replace')}"
+        )
+
+    first = max(start_line or 1, 1)
+    last = end_line if end_line is not None else first + 199
+    if last < first:
+        return f"Error: end_line ({last}) must be >= start_line ({first})"
+
+    page = []
+    page_bytes = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in itertools.islice(f, first - 1, last):
+            page_bytes += len(line)
+            if page and page_bytes > MAX_ARTIFACT_PAGE_BYTES:
+                break
+            page.append(line)
+    if not page:
+        return f"Error: start_line ({first}) is past the end of the artifact"
+
+    read_to = first + len(page) - 1
+    return f"[lines {first}-{read_to}, {total_bytes} bytes total]\n{''.join(page)}"
@@ -1,37 +1,179 @@
-import subprocess
+import asyncio
+import codecs
+import os
+import signal
 import threading
-from pathlib import Path
-from typing import Annotated
+import weakref
+from contextvars import ContextVar
+from typing import Annotated, Callable, Optional
 
 from langchain_core.tools import tool
 
-# Root directory for command execution
-ROOT_DIR = Path.cwd()
+from src.tools.workspace import get_workspace_root
 
-# Store for background processes: {process_id: {"process": Popen, "output": str}}
+# Maximum bytes of output retained per background process
+MAX_OUTPUT_BUFFER_BYTES = 1_000_000
+
+# Time to wait for a killed command's output pipe to close (seconds)
+READER_SHUTDOWN_TIMEOUT = 5.0
+
+# Optional callback receiving foreground command output as it is produced.
+# Set per tool call (e.g. by the ACP agent to stream progress to the client).
+command_output_listener: ContextVar[Optional[Callable[[str], None]]] = \
+    ContextVar("command_output_listener", default=None)
+
+# Store for background processes:
+# {process_id: {"process": asyncio Process, "output": OutputBuffer, "reader": Task}}
+# _lock guards the registry only; each OutputBuffer has its own lock
 _processes: dict[str, dict] = {}
 _process_counter = 0
 _lock = threading.Lock()
 
+# Processes whose group turned out to be empty; the group ID may be reused
+_empty_groups: "weakref.WeakSet[asyncio.subprocess.Process]" = weakref.WeakSet()
+
+
+class OutputBuffer:
+    """Bounded ring buffer for the output of a background process.
+
+    Keeps at most `capacity` bytes; older bytes are dropped and counted.
+    Every byte has an absolute offset so readers can ask for everything
+    "since offset N", and a read cursor tracks what was already consumed.
+    """
+
+    def __init__(self, capacity: int = MAX_OUTPUT_BUFFER_BYTES):
+        self.capacity = capacity
+        self._data = bytearray()
+        self._start_offset = 0  # Absolute offset of the first retained byte
+        self._read_cursor = 0  # Absolute offset of the first unread byte
+        self._lock = threading.Lock()
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Number of bytes dropped because the buffer was full."""
+        return self._start_offset
 
-def _read_output(process_id: str) -> None:
-    """Background thread to read process output."""
-    proc_info = _processes.get(process_id)
-    process = proc_info["process"]
+    @property
+    def end_offset(self) -> int:
+        """Absolute offset just past the last written byte."""
+        with self._lock:
+            return self._start_offset + len(self._data)
+
+    def append(self, data: bytes) -> None:
+        """Append output, dropping the oldest bytes beyond capacity."""
+        with self._lock:
+            self._data += data
+            excess = len(self._data) - self.capacity
+            if excess > 0:
+                # bytearray front deletion is amortized O(1) in CPython
+                del self._data[:excess]
+                self._start_offset += excess
+
+    def read(self, since_offset: Optional[int] = None,
+             advance: bool = True) -> tuple[str, int, int, int]:
+        """Read output from an absolute offset (default: the read cursor).
+
+        Returns:
+            (text, start_offset, end_offset, skipped): skipped is the number
+            of requested bytes that were already dropped.
+        """
+        with self._lock:
+            end = self._start_offset + len(self._data)
+            start = self._read_cursor if since_offset is None else since_offset
+            start = min(max(start, 0), end)
+            skipped = max(self._start_offset - start, 0)
+            start += skipped
+            data = bytes(self._data[start - self._start_offset:])
+            if advance:
+                self._read_cursor = max(self._read_cursor, end)
+        return data.decode("utf-8", errors="replace"), start, end, skipped
+
+
+async def _pump_output(process: asyncio.subprocess.Process,
+                       output: OutputBuffer) -> None:
+    """Background task to read process output into its buffer."""
     try:
         while True:
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
+            chunk = await process.stdout.read(65536)
+            if not chunk:
                 break
-            if line:
-                with _lock:
-                    proc_info["output"] += line
+            output.append(chunk)
     except Exception:
         pass
+    finally:
+        # Reap the process so its exit code is available
+        await process.wait()
+
+
+async def _collect_stream(stream: asyncio.StreamReader,
+                          chunks: list[bytes],
+                          listener: Optional[Callable[[str], None]]) -> None:
+    """Read a foreground stream to the end, forwarding it to the listener."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if listener is not None:
+            text = decoder.decode(chunk)
+            if text:
+                listener(text)
+
+
+def _signal_process_group(process: asyncio.subprocess.Process,
+                          sig: int, pipe_open: bool = False) -> None:
+    """Send a signal to the process and everything it spawned.
+
+    The group is signalled while it can still have members: the shell has
+    not been reaped, or children it started in the background still hold
+    its output pipe (pipe_open). Once killpg reports the group empty, or
+    after the shell was reaped and the pipe closed, the group ID may belong
+    to an unrelated process group and nothing is signalled.
+    """
+    if process in _empty_groups or (process.returncode is not None and not pipe_open):
+        return
+    try:
+        if hasattr(os, "killpg"):
+            # start_new_session=True makes the shell's PID the group ID
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+    except ProcessLookupError:
+        _empty_groups.add(process)
+
+
+async def _stop_process(process: asyncio.subprocess.Process,
+                        reader: Optional[asyncio.Task] = None,
+                        grace_period: float = 5) -> None:
+    """Terminate the process group, killing it if it does not exit in time.
+
+    If the output reader is given, it is awaited too: it only finishes once
+    every process holding the output pipe is gone.
+    """
+    def pipe_open() -> bool:
+        return reader is not None and not reader.done()
+
+    _signal_process_group(process, signal.SIGTERM, pipe_open())
+    waiters = [process.wait()]
+    if reader is not None:
+        waiters.append(asyncio.shield(reader))
+    try:
+        await asyncio.wait_for(asyncio.gather(*waiters), timeout=grace_period)
+        return
+    except asyncio.TimeoutError:
+        _signal_process_group(process, signal.SIGKILL, pipe_open())
+    await process.wait()
+    if reader is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(reader), READER_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # The pipe is held by a process outside the group (e.g. setsid)
+            reader.cancel()
 
 
 @tool
-def run_command(
+async def run_command(
     command: Annotated[str, "The shell command to execute"],
     working_dir: Annotated[str, "Working directory (relative to project root)"] = ".",
     background: Annotated[bool, "If True, run in background and return process ID"] = False,
@@ -44,51 +186,69 @@ def run_command(
     """
     global _process_counter
 
-    cwd = ROOT_DIR / working_dir
+    cwd = get_workspace_root() / working_dir
     if not cwd.exists():
         return f"Error: Directory '{working_dir}' does not exist"
 
     try:
         if background:
-            process = subprocess.Popen(
+            # Own session/process group so the whole tree can be stopped
+            process = await asyncio.create_subprocess_shell(
                 command,
-                shell=True,
                 cwd=str(cwd),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.PIPE,
-                text=True,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.PIPE,
+                start_new_session=True,
             )
+            output = OutputBuffer()
 
             with _lock:
                 _process_counter += 1
                 process_id = f"proc_{_process_counter}"
-                _processes[process_id] = {"process": process, "output": ""}
-
-            # Start background thread to read output
-            thread = threading.Thread(target=_read_output, args=(process_id,))
-            thread.daemon = True
-            thread.start()
+                _processes[process_id] = {
+                    "process": process,
+                    "output": output,
+                    # Read output on the event loop, no thread per process
+                    "reader": asyncio.create_task(_pump_output(process, output)),
+                }
 
             return f"Started background process: {process_id}"
         else:
-            result = subprocess.run(
+            process = await asyncio.create_subprocess_shell(
                 command,
-                shell=True,
                 cwd=str(cwd),
-                capture_output=True,
-                text=True,
-                timeout=timeout,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
             )
-            output = result.stdout
-            if result.stderr:
-                output += f"\n[stderr]: {result.stderr}"
-            if result.returncode != 0:
-                output += f"\n[exit code]: {result.returncode}"
+            listener = command_output_listener.get()
+            stdout_chunks: list[bytes] = []
+            stderr_chunks: list[bytes] = []
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        _collect_stream(process.stdout, stdout_chunks, listener),
+                        _collect_stream(process.stderr, stderr_chunks, listener),
+                        process.wait(),
+                    ),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                pipe_open = not (process.stdout.at_eof() and process.stderr.at_eof())
+                _signal_process_group(process, signal.SIGKILL, pipe_open)
+                await process.wait()
+                return f"Error: Command timed out after {timeout} seconds"
+
+            output = b"".join(stdout_chunks).decode("utf-8", errors="replace")
+            stderr = b"".join(stderr_chunks)
+            if stderr:
+                output += f"\n[stderr]: {stderr.decode('utf-8', errors='replace')}"
+            if process.returncode != 0:
+                output += f"\n[exit code]: {process.returncode}"
             return output or "(no output)"
 
-    except subprocess.TimeoutExpired:
-        return f"Error: Command timed out after {timeout} seconds"
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -96,30 +256,32 @@ def run_command(
 @tool
 def read_command_output(
     process_id: Annotated[str, "The process ID returned by run_command"],
-    clear: Annotated[bool, "If True, clear the output buffer after reading"] = True,
+    clear: Annotated[bool, "If True, mark the returned output as read so the next call only returns new output"] = True,
+    since_offset: Annotated[Optional[int], "Read all retained output from this byte offset (e.g. the end offset of a previous read) instead of the unread output"] = None,
 ) -> str:
     """Read output from a background command.
 
     Returns:
-        The accumulated output from the process.
+        The output from the process since the last read (or since the given offset).
     """
     with _lock:
         proc_info = _processes.get(process_id)
         if not proc_info:
             return f"Error: Process '{process_id}' not found"
 
-        output = proc_info["output"]
-        if clear:
-            proc_info["output"] = ""
-
+        output: OutputBuffer = proc_info["output"]
         process = proc_info["process"]
-        status = "running" if process.poll() is None else f"exited ({process.returncode})"
+        status = "running" if process.returncode is None else f"exited ({process.returncode})"
 
-    return f"[status: {status}]\n{output}" if output else f"[status: {status}]\n(no new output)"
+    text, start, end, skipped = output.read(since_offset, advance=clear)
+    header = f"[status: {status}] [offset: {start}-{end}]"
+    if skipped:
+        header += f" [{skipped} older bytes dropped from the output buffer]"
+    return f"{header}\n{text}" if text else f"{header}\n(no new output)"
 
 
 @tool
-def send_command_input(
+async def send_command_input(
     process_id: Annotated[str, "The process ID returned by run_command"],
     input_text: Annotated[str, "Text to send to the process stdin"],
     terminate: Annotated[bool, "If True, terminate the process instead of sending input"] = False,
@@ -137,21 +299,17 @@ def send_command_input(
         process = proc_info["process"]
 
     if terminate:
-        process.terminate()
-        try:
-            process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            process.kill()
+        await _stop_process(process, proc_info["reader"])
         with _lock:
-            del _processes[process_id]
+            _processes.pop(process_id, None)
         return f"Process '{process_id}' terminated"
 
-    if process.poll() is not None:
+    if process.returncode is not None:
         return f"Error: Process '{process_id}' has already exited"
 
     try:
-        process.stdin.write(input_text)
-        process.stdin.flush()
+        process.stdin.write(input_text.encode("utf-8"))
+        await process.stdin.drain()
         return f"Sent input to '{process_id}'"
     except Exception as e:
-        return f"Error sending input: {str(e)}"
\ No newline at end of file
+        return f"Error sending input: {str(e)}"
@@ -0,0 +1,232 @@
+"""Process-wide cache of file contents shared by the read, edit and search tools.
+
+Entries are validated against (mtime_ns, size, inode) on every access, so
+files changed outside the agent are re-read. Our own writes go through the
+cache. Eviction is LRU by total cached bytes.
+"""
+import os
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# Maximum total size of cached file contents (bytes)
+FILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Files larger than this are read from disk but never cached (bytes)
+MAX_CACHED_FILE_BYTES = 4 * 1024 * 1024
+
+PathLike = Union[str, Path]
+
+
+# Functions called with the path of every file written by atomic_write
+_write_listeners: list[Callable[[str], None]] = []
+
+
+def add_write_listener(listener: Callable[[str], None]) -> None:
+    """Call listener with the real path of every file written by atomic_write."""
+    _write_listeners.append(listener)
+
+
+@dataclass
+class FileCacheStats:
+    """Counters of the file cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    cached_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.0%} hit rate), "
+                f"{self.entries} files, {self.cached_bytes / 1024 / 1024:.1f} MB, "
+                f"{self.evictions} evictions")
+
+
+def _file_key(st: os.stat_result) -> tuple[int, int, int]:
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _universal_newlines(text: str) -> str:
+    """Translate line endings like text-mode open() does."""
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _create_temp_file(path: str) -> tuple[int, str]:
+    """Create a temporary file next to path.
+
+    Unlike mkstemp (mode 0600), the file is created with mode 0666, so the
+    kernel applies the process umask as for any other new file.
+
+    Returns:
+        (file descriptor, temporary path)
+    """
+    directory, name = os.path.split(path)
+    for _ in range(100):
+        temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            return os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), temp_path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free temporary file name for {path}")
+
+
+def atomic_write(path: str, data: bytes) -> tuple[int, int, int]:
+    """Write data to path via temp file, fsync and rename.
+
+    Returns:
+        The (mtime_ns, size, inode) key of the written file.
+    """
+    # Replace the target of a symlink, not the link itself
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        # New files keep the umask-based mode they were created with
+        mode = None
+    fd, temp_path = _create_temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            if mode is not None:
+                os.fchmod(f.fileno(), mode)
+            key = _file_key(os.fstat(f.fileno()))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    for listener in _write_listeners:
+        listener(path)
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return key
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+    return key
+
+
+class FileCache:
+    """LRU cache of file bytes keyed by absolute path."""
+
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES,
+                 max_file_bytes: int = MAX_CACHED_FILE_BYTES):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries: OrderedDict[str, tuple[tuple[int, int, int], bytes]] = OrderedDict()
+        self._size = 0
+        self._stats = FileCacheStats()
+        self._lock = threading.Lock()
+
+    def read_bytes(self, path: PathLike, max_bytes: Optional[int] = None,
+                   evict: bool = True) -> Optional[bytes]:
+        """Read a file through the cache.
+
+        Args:
+            path: File to read.
+            max_bytes: Return None instead of reading files larger than this.
+            evict: If False, the file is only cached when it fits without
+                evicting other entries (used by bulk scans such as searches).
+
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        path = os.path.abspath(path)
+        with open(path, "rb") as f:
+            key = _file_key(os.fstat(f.fileno()))
+            if max_bytes is not None and key[1] > max_bytes:
+                return None
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry[0] == key:
+                    self._entries.move_to_end(path)
+                    self._stats.hits += 1
+                    return entry[1]
+                self._stats.misses += 1
+            data = f.read()
+        # Only cache content that matches the stat it was read with
+        if len(data) == key[1]:
+            self._store(path, key, data, evict)
+        return data
+
+    def read_text(self, path: PathLike, encoding: str = "utf-8") -> str:
+        """Read a file as text with universal newlines, like Path.read_text()."""
+        return _universal_newlines(self.read_bytes(path).decode(encoding))
+
+    def write_text(self, path: PathLike, text: str, encoding: str = "utf-8") -> None:
+        """Write a file and keep the written content cached."""
+        self.write_bytes(path, text.encode(encoding))
+
+    def write_bytes(self, path: PathLike, data: bytes) -> None:
+        """Atomically write a file and keep the written content cached.
+
+        The data is written to a temporary file in the same directory,
+        fsynced and renamed over the target, so readers (and crashes) never
+        observe a partially written file. The file mode is preserved.
+        """
+        path = os.path.abspath(path)
+        key = atomic_write(path, data)
+        self._store(path, key, data, evict=True)
+
+    def invalidate(self, path: PathLike) -> None:
+        """Drop a file from the cache (e.g. after it was moved or deleted)."""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._size -= len(entry[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self) -> FileCacheStats:
+        with self._lock:
+            return FileCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                entries=len(self._entries),
+                cached_bytes=self._size,
+            )
+
+    def _store(self, path: str, key: tuple[int, int, int], data: bytes, evict: bool) -> None:
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            if len(data) > self.max_file_bytes:
+                return
+            if not evict and self._size + len(data) > self.max_bytes:
+                return
+            self._entries[path] = (key, data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats.evictions += 1
+
+
+# Shared cache used by all file tools
+file_cache = FileCache()
@@ -1,43 +1,71 @@
-import subprocess
-from pathlib import Path
-from typing import Annotated
+import os
+import re
+from typing import Annotated, Optional
 
 from langchain_core.tools import tool
 
-# Root directory for file operations (where python command is executed)
-ROOT_DIR = Path.cwd()
+from src.tools.search_engine import format_search_result, search
+from src.tools.trigram_index import get_trigram_index
+from src.tools.workspace import get_workspace_root
+
+
+def _search_index_enabled() -> bool:
+    """Check whether the optional trigram index is enabled (SEARCH_INDEX env)."""
+    return os.getenv("SEARCH_INDEX", "false").lower() in ("1", "true", "yes")
 
 
 @tool
 def grep_search(
-    pattern: Annotated[str, "The regex pattern to search for"],
+    pattern: Annotated[str, "The regex pattern to search for (Python regex syntax)"],
     path: Annotated[str, "The file or directory path to search in (relative to project root)"] = ".",
     case_insensitive: Annotated[bool, "If True, perform case-insensitive search"] = False,
+    include: Annotated[Optional[str], "Only search files matching this glob, e.g. '*.py' or 'src/**/*.ts'"] = None,
+    context_lines: Annotated[int, "Number of context lines to show before and after each match"] = 0,
+    max_results: Annotated[int, "Maximum number of matching lines to return"] = 200,
 ) -> str:
-    """Search for a pattern in files using grep.
+    """Search for a regex pattern in files.
+
+    Skips files ignored by .gitignore, vendored/cache directories
+    (.git, node_modules, .venv, ...) and binary files.
 
     Returns:
-        Matching lines with file names and line numbers.
+        Matching lines as path:line:content, relative to the project root.
     """
-    search_path = ROOT_DIR / path
+    root = get_workspace_root()
+    search_path = root / path
 
     if not search_path.exists():
         return f"Error: Path '{path}' does not exist"
 
-    cmd = ["grep", "-rn"]
-    if case_insensitive:
-        cmd.append("-i")
-    cmd.extend([pattern, str(search_path)])
-
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode == 0:
-            return result.stdout or "No matches found"
-        elif result.returncode == 1:
-            return "No matches found"
-        else:
-            return f"Error: {result.stderr}"
-    except subprocess.TimeoutExpired:
-        return "Error: Search timed out"
+        # Narrow the search to candidate files with the trigram index
+        candidates = None
+        index = None
+        if _search_index_enabled() and search_path.is_dir():
+            index = get_trigram_index(root)
+            candidates = index.candidates(pattern, case_insensitive,
+                                          search_path, include)
+
+        result = search(
+            search_path,
+            pattern,
+            case_insensitive=case_insensitive,
+            include=include,
+            context_lines=max(context_lines, 0),
+            max_results=max(max_results, 1),
+            files=candidates,
+            workspace=root,
+        )
+        output = format_search_result(result)
+        if candidates is not None:
+            stats = index.get_stats()
+            output += (f"\n[index: {stats['candidates']} candidate files of "
+                       f"{stats['files']}, refresh {stats['refresh_seconds'] * 1000:.1f} ms, "
+                       f"lookup {stats['query_seconds'] * 1000:.1f} ms]")
+        elif index is not None and not index.ready:
+            output += "\n[index: building in the background, searched without it]"
+        return output
+    except re.error as e:
+        return f"Error: Invalid regex pattern: {e}"
     except Exception as e:
         return f"Error: {str(e)}"
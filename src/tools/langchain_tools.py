@@ -1,9 +1,91 @@
 from pathlib import Path
+from typing import Optional
 
-from langchain_community.agent_toolkits import FileManagementToolkit
+from langchain_community.tools import CopyFileTool, DeleteFileTool, \
+    FileSearchTool, ListDirectoryTool, MoveFileTool, ReadFileTool, \
+    WriteFileTool
+from langchain_community.tools.file_management.utils import (
+    INVALID_PATH_TEMPLATE,
+    BaseFileToolMixin,
+    FileValidationError,
+    get_validated_relative_path,
+)
+from langchain_core.callbacks import CallbackManagerForToolRun
+
+from src.tools.file_cache import file_cache
+from src.tools.workspace import get_workspace_root
+
+
+class WorkspaceFileToolMixin(BaseFileToolMixin):
+    """Resolves paths against the current session's workspace root."""
+
+    def get_relative_path(self, file_path: str) -> Path:
+        return get_validated_relative_path(get_workspace_root(), file_path)
+
+
+class WorkspaceCopyFileTool(WorkspaceFileToolMixin, CopyFileTool):
+    pass
+
+
+class WorkspaceDeleteFileTool(WorkspaceFileToolMixin, DeleteFileTool):
+    pass
+
+
+class WorkspaceFileSearchTool(WorkspaceFileToolMixin, FileSearchTool):
+    pass
+
+
+class WorkspaceMoveFileTool(WorkspaceFileToolMixin, MoveFileTool):
+    pass
+
+
+class WorkspaceListDirectoryTool(WorkspaceFileToolMixin, ListDirectoryTool):
+    pass
+
+
+class CachedReadFileTool(WorkspaceFileToolMixin, ReadFileTool):
+    """ReadFileTool that reads through the shared file cache."""
+
+    def _run(
+        self,
+        file_path: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        try:
+            read_path = self.get_relative_path(file_path)
+        except FileValidationError:
+            return INVALID_PATH_TEMPLATE.format(arg_name="file_path", value=file_path)
+        if not read_path.exists():
+            return f"Error: no such file or directory: {file_path}"
+        try:
+            return file_cache.read_text(read_path)
+        except Exception as e:
+            return "Error: " + str(e)
+
+
+class CachedWriteFileTool(WorkspaceFileToolMixin, WriteFileTool):
+    """WriteFileTool that writes through the shared file cache."""
+
+    def _run(
+        self,
+        file_path: str,
+        text: str,
+        append: bool = False,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        if append:
+            return super()._run(file_path, text, append, run_manager)
+        try:
+            write_path = self.get_relative_path(file_path)
+        except FileValidationError:
+            return INVALID_PATH_TEMPLATE.format(arg_name="file_path", value=file_path)
+        try:
+            write_path.parent.mkdir(exist_ok=True, parents=True)
+            file_cache.write_text(write_path, text)
+            return f"File written successfully to {file_path}."
+        except Exception as e:
+            return "Error: " + str(e)
 
-# Root directory for file operations (where python command is executed)
-ROOT_DIR = Path.cwd()
 
 def get_langchain_tools() -> list:
     """Get file management tools from LangChain.
@@ -14,17 +96,15 @@ def get_langchain_tools() -> list:
             ReadFileTool,
             WriteFileTool, <- write a new file
             ListDirectoryTool,
+    Paths are resolved against the current session's workspace root;
+    read_file and write_file go through the shared file cache.
     """
-    toolkit = FileManagementToolkit(
-        root_dir=str(ROOT_DIR),
-        selected_tools=[
-            "copy_file",
-            "file_delete",
-            "file_search",
-            "move_file",
-            "read_file",
-            "write_file",
-            "list_directory",
-        ],
-    )
-    return toolkit.get_tools()
+    return [
+        WorkspaceCopyFileTool(),
+        WorkspaceDeleteFileTool(),
+        WorkspaceFileSearchTool(),
+        WorkspaceMoveFileTool(),
+        CachedReadFileTool(),
+        CachedWriteFileTool(),
+        WorkspaceListDirectoryTool(),
+    ]
@@ -1,10 +1,10 @@
-from pathlib import Path
 from typing import Annotated
 
 from langchain_core.tools import tool
+from pydantic import BaseModel, Field
 
-# Root directory for file operations
-ROOT_DIR = Path.cwd()
+from src.tools.file_cache import file_cache
+from src.tools.workspace import get_workspace_root
 
 
 @tool
@@ -29,7 +29,7 @@ def replace_file_content(
     Returns:
         Success message or error description.
     """
-    file_path = ROOT_DIR / target_file
+    file_path = get_workspace_root() / target_file
 
     if not file_path.exists():
         return f"Error: File '{target_file}' does not exist"
@@ -45,7 +45,7 @@ def replace_file_content(
         return f"Error: end_line ({end_line}) must be >= start_line ({start_line})"
 
     try:
-        content = file_path.read_text(encoding="utf-8")
+        content = file_cache.read_text(file_path)
         lines = content.splitlines(keepends=True)
         total_lines = len(lines)
 
@@ -79,10 +79,128 @@ def replace_file_content(
         new_content = before + new_region + after
 
         # Write back
-        file_path.write_text(new_content, encoding="utf-8")
+        file_cache.write_text(file_path, new_content)
 
         replaced_count = occurrences if allow_multiple else 1
         return f"Successfully replaced {replaced_count} occurrence(s) in '{target_file}'"
 
     except Exception as e:
         return f"Error: {str(e)}"
+
+
+class ReplacementChunk(BaseModel):
+    """A single edit of multi_replace_file_content."""
+    start_line: int = Field(description="Starting line number (1-indexed) to search within")
+    end_line: int = Field(description="Ending line number (1-indexed, inclusive) to search within")
+    target_content: str = Field(description="Exact text to replace (must match exactly, including whitespace)")
+    replacement_content: str = Field(description="New content to replace the target with")
+    allow_multiple: bool = Field(
+        default=False,
+        description="If True, replace all occurrences in the range; if False, error on multiple matches")
+
+
+def _plan_chunk(lines: list[str], line_offsets: list[int],
+                chunk: ReplacementChunk) -> tuple[int, int, str, int]:
+    """Validate one chunk against the original file.
+
+    Returns:
+        (region_start, region_end, new_region, replaced_count) in character offsets.
+
+    Raises:
+        ValueError: If the chunk does not apply.
+    """
+    total_lines = len(lines)
+    if chunk.start_line < 1:
+        raise ValueError(f"start_line must be >= 1, got {chunk.start_line}")
+    if chunk.end_line < chunk.start_line:
+        raise ValueError(f"end_line ({chunk.end_line}) must be >= start_line ({chunk.start_line})")
+    if chunk.end_line > total_lines:
+        raise ValueError(f"end_line ({chunk.end_line}) exceeds file length ({total_lines} lines)")
+    if not chunk.target_content:
+        raise ValueError("target_content must not be empty")
+
+    region_start = line_offsets[chunk.start_line - 1]
+    region_end = line_offsets[chunk.end_line]
+    search_region = "".join(lines[chunk.start_line - 1: chunk.end_line])
+    occurrences = search_region.count(chunk.target_content)
+    if occurrences == 0:
+        raise ValueError(f"Target content not found in lines {chunk.start_line}-{chunk.end_line}")
+    if occurrences > 1 and not chunk.allow_multiple:
+        raise ValueError(
+            f"Found {occurrences} occurrences of target content in lines "
+            f"{chunk.start_line}-{chunk.end_line}. Set allow_multiple=True or narrow the range."
+        )
+    new_region = search_region.replace(chunk.target_content, chunk.replacement_content)
+    return region_start, region_end, new_region, occurrences
+
+
+@tool
+def multi_replace_file_content(
+        target_file: Annotated[str, "Relative path to the file to edit"],
+        replacement_chunks: Annotated[
+            list[ReplacementChunk],
+            "Edits to apply; line numbers refer to the file BEFORE any edit"],
+) -> str:
+    """Replace multiple non-contiguous blocks of content in a file in one pass.
+
+    All chunks are validated against the original file before anything is
+    written. If any chunk fails, the file is left untouched. The new content
+    is written atomically (temp file, fsync, rename).
+
+    Returns:
+        Success message or a description of every failing chunk.
+    """
+    file_path = get_workspace_root() / target_file
+
+    if not file_path.exists():
+        return f"Error: File '{target_file}' does not exist"
+
+    if not file_path.is_file():
+        return f"Error: '{target_file}' is not a file"
+
+    if not replacement_chunks:
+        return "Error: replacement_chunks must not be empty"
+
+    try:
+        content = file_cache.read_text(file_path)
+        lines = content.splitlines(keepends=True)
+        line_offsets = [0]
+        for line in lines:
+            line_offsets.append(line_offsets[-1] + len(line))
+
+        # Validate every chunk before touching the file
+        planned = []
+        errors = []
+        for index, chunk in enumerate(replacement_chunks, start=1):
+            if isinstance(chunk, dict):
+                chunk = ReplacementChunk(**chunk)
+            try:
+                planned.append((*_plan_chunk(lines, line_offsets, chunk), index))
+            except ValueError as e:
+                errors.append(f"chunk {index} (lines {chunk.start_line}-{chunk.end_line}): {e}")
+
+        planned.sort()
+        for previous, current in zip(planned, planned[1:]):
+            if current[0] < previous[1]:
+                errors.append(f"chunk {current[4]} overlaps the line range of chunk {previous[4]}")
+
+        if errors:
+            return "Error: no changes were made.\n" + "\n".join(errors)
+
+        # Splice the new regions in a single pass
+        parts = []
+        position = 0
+        replaced_count = 0
+        for region_start, region_end, new_region, occurrences, _ in planned:
+            parts.append(content[position:region_start])
+            parts.append(new_region)
+            position = region_end
+            replaced_count += occurrences
+        parts.append(content[position:])
+
+        file_cache.write_text(file_path, "".join(parts))
+        return (f"Successfully applied {len(planned)} chunk(s) "
+                f"({replaced_count} replacement(s)) in '{target_file}'")
+
+    except Exception as e:
+        return f"Error: {str(e)}"
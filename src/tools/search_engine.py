@@ -0,0 +1,523 @@
+"""In-process, gitignore-aware parallel search engine used by grep_search.
+
+The tree is walked level by level with os.scandir on a thread pool,
+skipping ignored paths (.gitignore / .ignore files plus a default set of
+vendored and cache directories). Candidate files are then scanned in
+parallel in path order, so the search can stop as soon as max_results
+matches were found.
+"""
+import fnmatch
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+from src.tools.file_cache import file_cache
+
+# Directories that are never searched
+DEFAULT_IGNORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".venv",
+    "venv",
+    "node_modules",
+    "__pycache__",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    ".tox",
+    ".code-buddy",
+}
+
+# Ignore files read in every directory, in precedence order
+IGNORE_FILES = (".gitignore", ".ignore")
+
+# Files larger than this are skipped
+MAX_FILE_BYTES = 10_000_000
+
+# Number of leading bytes inspected to detect binary files
+BINARY_SNIFF_BYTES = 8192
+
+# Matched lines longer than this are truncated in the results
+MAX_LINE_CHARS = 300
+
+# Number of worker threads for walking and scanning
+SEARCH_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+
+# Number of files scanned per worker task
+SCAN_BATCH_SIZE = 64
+
+# Pattern syntax that can match a line on its own but not inside the whole
+# file, which rules out the whole-file prefilter
+_NO_PREFILTER_TOKENS = ("$", "\\A", "\\Z", "(?!", "(?<!")
+
+
+@dataclass
+class SearchMatch:
+    """A matching line and its surrounding context."""
+    path: str  # Relative to the workspace (or the search root)
+    line_number: int
+    line: str
+    before: list[tuple[int, str]] = field(default_factory=list)
+    after: list[tuple[int, str]] = field(default_factory=list)
+
+
+@dataclass
+class SearchResult:
+    """Structured result of a search."""
+    matches: list[SearchMatch] = field(default_factory=list)
+    files_searched: int = 0
+    files_matched: int = 0
+    truncated: bool = False  # True if max_results stopped the search
+
+
+@dataclass(frozen=True)
+class _IgnorePattern:
+    """A single compiled gitignore pattern."""
+    base: str  # Directory of the ignore file, relative to the workspace
+    regex: re.Pattern
+    negated: bool
+    dir_only: bool
+    anchored: bool
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression."""
+    regex = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex.append("(?:/.*)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif char == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif char == "?":
+            regex.append("[^/]")
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex.append(re.escape(char))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex.append(f"[{body}]")
+                i = end + 1
+        elif char == "\\" and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(char))
+            i += 1
+    return "".join(regex)
+
+
+def _parse_ignore_line(line: str, base: str) -> Optional[_IgnorePattern]:
+    """Compile one line of an ignore file, or return None for blanks/comments."""
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    anchored = "/" in line
+    line = line.lstrip("/")
+    return _IgnorePattern(
+        base=base,
+        regex=re.compile(_glob_to_regex(line)),
+        negated=negated,
+        dir_only=dir_only,
+        anchored=anchored,
+    )
+
+
+class IgnoreRules:
+    """Stack of ignore patterns collected from the workspace down to a directory."""
+
+    def __init__(self, patterns: tuple[_IgnorePattern, ...] = ()):
+        self._patterns = patterns
+
+    def child(self, directory: Path, rel_dir: str) -> "IgnoreRules":
+        """Return the rules for a directory, adding its own ignore files."""
+        patterns = list(self._patterns)
+        for ignore_file in IGNORE_FILES:
+            ignore_path = directory / ignore_file
+            try:
+                lines = ignore_path.read_text(encoding="utf-8", errors="replace").splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                pattern = _parse_ignore_line(line, rel_dir)
+                if pattern is not None:
+                    patterns.append(pattern)
+        if len(patterns) == len(self._patterns):
+            return self
+        return IgnoreRules(tuple(patterns))
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """Check a workspace-relative path; the last matching pattern wins."""
+        ignored = False
+        name = rel_path.rsplit("/", 1)[-1]
+        for pattern in self._patterns:
+            if pattern.dir_only and not is_dir:
+                continue
+            if pattern.base:
+                if not rel_path.startswith(pattern.base + "/"):
+                    continue
+                local_path = rel_path[len(pattern.base) + 1:]
+            else:
+                local_path = rel_path
+            target = local_path if pattern.anchored else name
+            if pattern.regex.fullmatch(target):
+                ignored = not pattern.negated
+        return ignored
+
+
+def _scan_directory(
+    directory: Path,
+    rel_dir: str,
+    rules: IgnoreRules,
+    include: Optional[str],
+) -> tuple[list[tuple[str, str]], list[tuple[Path, str, IgnoreRules]]]:
+    """List one directory.
+
+    Returns:
+        (files, subdirectories): files as (relative path, full path),
+        subdirectories with the ignore rules that apply inside them.
+    """
+    rules = rules.child(directory, rel_dir)
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    is_file = entry.is_file()
+                except OSError:
+                    continue
+                if is_dir:
+                    if entry.name in DEFAULT_IGNORED_DIRS or rules.is_ignored(rel_path, True):
+                        continue
+                    subdirectories.append((Path(entry.path), rel_path, rules))
+                elif is_file:
+                    if rules.is_ignored(rel_path, False):
+                        continue
+                    if include and not fnmatch.fnmatch(entry.name, include) \
+                            and not fnmatch.fnmatch(rel_path, include):
+                        continue
+                    files.append((rel_path, entry.path))
+    except OSError:
+        pass
+    return files, subdirectories
+
+
+def _ancestor_rules(workspace: Path, root: Path) -> tuple[str, IgnoreRules]:
+    """Collect the ignore rules of the directories between workspace and root.
+
+    Returns:
+        (rel_root, rules): root relative to the workspace and the rules that
+        apply inside it (excluding root's own ignore files).
+    """
+    try:
+        parts = root.resolve().relative_to(workspace.resolve()).parts
+    except ValueError:
+        return "", IgnoreRules()
+
+    rules = IgnoreRules()
+    directory = workspace
+    rel_dir = ""
+    for part in parts:
+        rules = rules.child(directory, rel_dir)
+        directory = directory / part
+        rel_dir = f"{rel_dir}/{part}" if rel_dir else part
+    return rel_dir, rules
+
+
+def _directory_mtime(directory: Path) -> Optional[int]:
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def walk_tree(
+    root: Path,
+    include: Optional[str] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    workspace: Optional[Path] = None,
+) -> tuple[list[tuple[str, str]], list[tuple[str, str, Optional[int]]]]:
+    """Walk a tree like walk_files, also returning the directories walked.
+
+    Returns:
+        (files, directories): directories as (relative path, full path,
+        mtime_ns), the mtime taken before the directory was listed (None if
+        it could not be read).
+    """
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    try:
+        rel_root, rules = _ancestor_rules(workspace or root, root)
+        files: list[tuple[str, str]] = []
+        directories: list[tuple[str, str, Optional[int]]] = []
+        level = [(root, rel_root, rules)]
+        while level:
+            results = executor.map(
+                lambda item: (_directory_mtime(item[0]),
+                              _scan_directory(item[0], item[1], item[2], include)),
+                level,
+            )
+            next_level = []
+            for (directory, rel_dir, _), (mtime_ns, (dir_files, subdirectories)) \
+                    in zip(level, results):
+                directories.append((rel_dir, str(directory), mtime_ns))
+                files.extend(dir_files)
+                next_level.extend(subdirectories)
+            level = next_level
+        files.sort(key=lambda item: item[0])
+        return files, directories
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def walk_files(
+    root: Path,
+    include: Optional[str] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    workspace: Optional[Path] = None,
+) -> list[tuple[str, str]]:
+    """Walk a tree in parallel, returning non-ignored files sorted by path.
+
+    Paths are relative to workspace (if root is inside it) so that ignore
+    files of parent directories apply, otherwise relative to root.
+    """
+    return walk_tree(root, include, executor, workspace)[0]
+
+
+def scan_directory(
+    directory: Path,
+    workspace: Path,
+) -> tuple[Optional[int], list[tuple[str, str]], list[tuple[str, str]]]:
+    """List one directory with the ignore rules walk_files applies to it.
+
+    Returns:
+        (mtime_ns, files, subdirectories): the directory's mtime taken before
+        listing it (None if it cannot be read), then its non-ignored files
+        and subdirectories as (relative path, full path).
+    """
+    rel_dir, rules = _ancestor_rules(workspace, directory)
+    mtime_ns = _directory_mtime(directory)
+    files, subdirectories = _scan_directory(directory, rel_dir, rules, None)
+    return mtime_ns, files, [(rel_path, str(path)) for path, rel_path, _ in subdirectories]
+
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    """Read a file, or return None for binary, huge or unreadable files."""
+    try:
+        # Searches only fill free cache space, never evicting files being edited
+        data = file_cache.read_bytes(path, max_bytes=MAX_FILE_BYTES, evict=False)
+    except OSError:
+        return None
+    if data is None:
+        return None
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    return data
+
+
+def split_lines(text: str) -> list[str]:
+    """Split text into lines like grep and editors do.
+
+    Only "\n" ends a line (a trailing "\r" is dropped). str.splitlines()
+    also splits on form feeds, "\x85", "\u2028" and other separators,
+    which shifts the reported line numbers.
+    """
+    lines = text.split("\n")
+    if not lines[-1]:
+        # Text ending with a newline (or empty) has no extra last line
+        lines.pop()
+    if "\r" in text:
+        lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+    return lines
+
+
+def _truncate_line(line: str) -> str:
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "..."
+
+
+def _compile_prefilter(pattern: str, flags: int) -> Optional[re.Pattern]:
+    """Compile the whole-file check that rejects files without any match.
+
+    Matching the whole text must find every file in which some line
+    matches. With re.MULTILINE that holds for '^', but not for '$' (lines
+    ending in CR), start/end-of-text anchors, or negative lookarounds that
+    see the neighbouring line. Those patterns are checked line by line only.
+    """
+    if any(token in pattern for token in _NO_PREFILTER_TOKENS):
+        return None
+    return re.compile(pattern, flags | re.MULTILINE)
+
+
+def _search_text(
+    rel_path: str,
+    text: str,
+    regex: re.Pattern,
+    context_lines: int,
+    limit: int,
+    prefilter: Optional[re.Pattern] = None,
+) -> list[SearchMatch]:
+    """Find matching lines in a file's text."""
+    # Fast path: most files do not match at all
+    if prefilter is not None and not prefilter.search(text):
+        return []
+
+    lines = split_lines(text)
+    matches = []
+    for index, line in enumerate(lines):
+        if not regex.search(line):
+            continue
+        match = SearchMatch(path=rel_path, line_number=index + 1,
+                            line=_truncate_line(line))
+        if context_lines:
+            start = max(index - context_lines, 0)
+            end = min(index + context_lines + 1, len(lines))
+            match.before = [(n + 1, _truncate_line(lines[n])) for n in range(start, index)]
+            match.after = [(n + 1, _truncate_line(lines[n])) for n in range(index + 1, end)]
+        matches.append(match)
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+def search(
+    root: Path,
+    pattern: str,
+    case_insensitive: bool = False,
+    include: Optional[str] = None,
+    context_lines: int = 0,
+    max_results: int = 200,
+    files: Optional[Iterable[tuple[str, str]]] = None,
+    workspace: Optional[Path] = None,
+) -> SearchResult:
+    """Search files under root for a regex pattern.
+
+    Args:
+        root: File or directory to search
+        pattern: Python regular expression
+        case_insensitive: Ignore case when matching
+        include: Optional glob filter on file names or relative paths (e.g. "*.py")
+        context_lines: Number of lines of context around each match
+        max_results: Stop after this many matching lines
+        files: Optional pre-selected candidate files (relative path, full path)
+        workspace: Project root; paths are reported relative to it and its
+            ignore files apply when searching a subdirectory
+
+    Raises:
+        re.error: If the pattern is not a valid regular expression.
+    """
+    flags = re.IGNORECASE if case_insensitive else 0
+    regex = re.compile(pattern, flags)
+    prefilter = _compile_prefilter(pattern, flags)
+    # On pure-ASCII files an ASCII pattern behaves the same on bytes, which
+    # lets most files be rejected without decoding them
+    bytes_regex = None
+    if prefilter is not None and pattern.isascii():
+        try:
+            bytes_regex = re.compile(pattern.encode("ascii"), flags | re.MULTILINE)
+        except re.error:
+            # Valid str-only syntax such as \N{...} or (?u)
+            bytes_regex = None
+    result = SearchResult()
+
+    def scan(item: tuple[str, str]) -> list[SearchMatch]:
+        data = _read_bytes(item[1])
+        if data is None:
+            return []
+        if bytes_regex is not None and data.isascii():
+            if not bytes_regex.search(data):
+                return []
+            text = data.decode("ascii")
+        else:
+            text = data.decode("utf-8", errors="replace")
+        return _search_text(item[0], text, regex, context_lines, max_results, prefilter)
+
+    def scan_batch(batch: list[tuple[str, str]]) -> list[list[SearchMatch]]:
+        return [scan(item) for item in batch]
+
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        if files is None:
+            if root.is_file():
+                rel_path, _ = _ancestor_rules(workspace or root.parent, root)
+                files = [(rel_path or root.name, str(root))]
+            else:
+                files = walk_files(root, include, executor, workspace)
+        files = list(files)
+
+        # Batches are scanned in parallel but consumed in path order
+        futures = [
+            executor.submit(scan_batch, files[start:start + SCAN_BATCH_SIZE])
+            for start in range(0, len(files), SCAN_BATCH_SIZE)
+        ]
+        for future in futures:
+            for file_matches in future.result():
+                result.files_searched += 1
+                if not file_matches:
+                    continue
+                result.files_matched += 1
+                remaining = max_results - len(result.matches)
+                result.matches.extend(file_matches[:remaining])
+                if len(result.matches) >= max_results:
+                    # Early exit: drop the batches that have not started
+                    result.truncated = True
+                    for pending in futures:
+                        pending.cancel()
+                    return result
+
+    return result
+
+
+def format_search_result(result: SearchResult) -> str:
+    """Format a search result as grep-style text (path:line:content)."""
+    if not result.matches:
+        return "No matches found"
+
+    lines = []
+    previous: Optional[SearchMatch] = None
+    for match in result.matches:
+        has_context = match.before or match.after
+        if has_context and previous is not None:
+            lines.append("--")
+        for number, text in match.before:
+            lines.append(f"{match.path}-{number}-{text}")
+        lines.append(f"{match.path}:{match.line_number}:{match.line}")
+        for number, text in match.after:
+            lines.append(f"{match.path}-{number}-{text}")
+        previous = match
+
+    summary = (f"[{len(result.matches)} matches in {result.files_matched} files, "
+               f"{result.files_searched} files searched]")
+    if result.truncated:
+        summary += " [results truncated at max_results - narrow the pattern or path]"
+    lines.append(summary)
+    return "\n".join(lines)
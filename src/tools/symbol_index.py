@@ -0,0 +1,418 @@
+"""Symbol index for definition and reference lookups.
+
+Python sources are parsed with `ast`. Other languages use a pluggable
+regex-based extractor: register_language() maps file extensions to a
+function returning the symbols and references of a file.
+
+The index is kept in memory per workspace and updated incrementally:
+every lookup stats the workspace and re-parses only the files whose
+(mtime_ns, size) changed, so symbols written a moment ago are found.
+"""
+import ast
+import os
+import posixpath
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Annotated, Callable, Optional
+
+from langchain_core.tools import tool
+
+from src.tools.file_cache import file_cache
+from src.tools.search_engine import MAX_FILE_BYTES, split_lines, walk_files
+from src.tools.workspace import get_workspace_root
+
+# Symbol kinds that are not definitions of their own
+_IMPORT_KIND = "import"
+
+
+@dataclass
+class Symbol:
+    """A symbol definition (class, function, method, variable, import...)."""
+    name: str
+    kind: str
+    path: str
+    line: int
+    column: int = 0
+    container: Optional[str] = None  # Enclosing class/function, if any
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.container}.{self.name}" if self.container else self.name
+
+
+@dataclass
+class FileSymbols:
+    """Symbols defined in a file and the positions where names are used."""
+    definitions: list[Symbol] = field(default_factory=list)
+    references: dict[str, list[tuple[int, int]]] = field(default_factory=dict)  # name -> [(line, column)]
+
+
+# Language extractors: {extension: extractor(path, text) -> FileSymbols}
+Extractor = Callable[[str, str], FileSymbols]
+_extractors: dict[str, Extractor] = {}
+
+
+def register_language(extensions: list[str], extractor: Extractor) -> None:
+    """Register a symbol extractor for the given file extensions (e.g. ['.py'])."""
+    for extension in extensions:
+        _extractors[extension.lower()] = extractor
+
+
+def _add_reference(symbols: FileSymbols, name: str, line: int, column: int) -> None:
+    symbols.references.setdefault(name, []).append((line, column))
+
+
+class _PythonVisitor(ast.NodeVisitor):
+    """Collects definitions, imports and name usages from a Python module."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.symbols = FileSymbols()
+        self._containers: list[tuple[str, str]] = []  # (name, kind)
+
+    def _define(self, name: str, kind: str, node: ast.AST) -> None:
+        container = ".".join(name for name, _ in self._containers) or None
+        self.symbols.definitions.append(Symbol(
+            name=name, kind=kind, path=self.path, line=node.lineno,
+            column=node.col_offset, container=container))
+
+    def _visit_scope(self, node, kind: str) -> None:
+        self._define(node.name, kind, node)
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        for child in getattr(node, "bases", []) + getattr(node, "keywords", []):
+            self.visit(child)
+        if not isinstance(node, ast.ClassDef):
+            self.visit(node.args)
+            if node.returns is not None:
+                self.visit(node.returns)
+        self._containers.append((node.name, kind))
+        for statement in node.body:
+            self.visit(statement)
+        self._containers.pop()
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._visit_scope(node, "class")
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        in_class = bool(self._containers) and self._containers[-1][1] == "class"
+        self._visit_scope(node, "method" if in_class else "function")
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _define_targets(self, target: ast.AST) -> None:
+        if isinstance(target, ast.Name):
+            self._define(target.id, "variable", target)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._define_targets(element)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        # Module and class level assignments are definitions
+        if not self._containers or self._containers[-1][1] == "class":
+            for target in node.targets:
+                self._define_targets(target)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+        if not self._containers or self._containers[-1][1] == "class":
+            self._define_targets(node.target)
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            self._define(name, _IMPORT_KIND, node)
+            _add_reference(self.symbols, alias.name.split(".")[-1], node.lineno, node.col_offset)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            self._define(alias.asname or alias.name, _IMPORT_KIND, node)
+            _add_reference(self.symbols, alias.name, node.lineno, node.col_offset)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        _add_reference(self.symbols, node.id, node.lineno, node.col_offset)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        _add_reference(self.symbols, node.attr, node.end_lineno or node.lineno,
+                       max((node.end_col_offset or 0) - len(node.attr), 0))
+        self.visit(node.value)
+
+
+def _extract_python(path: str, text: str) -> FileSymbols:
+    """Extract symbols from Python source with ast (regex fallback on syntax errors)."""
+    try:
+        tree = ast.parse(text, filename=path)
+    except (SyntaxError, ValueError):
+        return _make_regex_extractor(_PYTHON_PATTERNS)(path, text)
+    visitor = _PythonVisitor(path)
+    visitor.visit(tree)
+    return visitor.symbols
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+
+_PYTHON_PATTERNS = [
+    ("class", r"^\s*class\s+(\w+)"),
+    ("function", r"^\s*(?:async\s+)?def\s+(\w+)"),
+]
+
+
+def _make_regex_extractor(patterns: list[tuple[str, str]]) -> Extractor:
+    """Build an extractor from (kind, regex) pairs; group 1 is the symbol name.
+
+    Every identifier in the file is recorded as a reference.
+    """
+    compiled = [(kind, re.compile(pattern, re.MULTILINE)) for kind, pattern in patterns]
+
+    def extract(path: str, text: str) -> FileSymbols:
+        symbols = FileSymbols()
+        line_starts = [0]
+        line_starts.extend(match.end() for match in re.finditer("\n", text))
+
+        def position(offset: int) -> tuple[int, int]:
+            low, high = 0, len(line_starts) - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if line_starts[middle] <= offset:
+                    low = middle
+                else:
+                    high = middle - 1
+            return low + 1, offset - line_starts[low]
+
+        for kind, regex in compiled:
+            for match in regex.finditer(text):
+                line, column = position(match.start(1))
+                symbols.definitions.append(Symbol(
+                    name=match.group(1), kind=kind, path=path, line=line, column=column))
+        for match in _IDENTIFIER.finditer(text):
+            line, column = position(match.start())
+            _add_reference(symbols, match.group(), line, column)
+        return symbols
+
+    return extract
+
+
+register_language([".py", ".pyi"], _extract_python)
+register_language([".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"], _make_regex_extractor([
+    ("class", r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"),
+    ("function", r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)"),
+    ("variable", r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)"),
+    ("interface", r"^\s*(?:export\s+)?interface\s+([A-Za-z_$][\w$]*)"),
+    ("type", r"^\s*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*[=<]"),
+    ("enum", r"^\s*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)"),
+]))
+register_language([".go"], _make_regex_extractor([
+    ("function", r"^func\s+(?:\([^)]*\)\s*)?(\w+)"),
+    ("type", r"^type\s+(\w+)"),
+    ("variable", r"^(?:var|const)\s+(\w+)"),
+]))
+register_language([".rs"], _make_regex_extractor([
+    ("function", r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+(\w+)"),
+    ("struct", r"^\s*(?:pub(?:\([^)]*\))?\s+)?struct\s+(\w+)"),
+    ("enum", r"^\s*(?:pub(?:\([^)]*\))?\s+)?enum\s+(\w+)"),
+    ("trait", r"^\s*(?:pub(?:\([^)]*\))?\s+)?trait\s+(\w+)"),
+    ("module", r"^\s*(?:pub(?:\([^)]*\))?\s+)?mod\s+(\w+)"),
+]))
+register_language([".java", ".kt", ".cs", ".scala"], _make_regex_extractor([
+    ("class", r"^\s*(?:[\w@]+\s+)*(?:class|interface|enum|record|object)\s+(\w+)"),
+    ("function", r"^\s*(?:(?:public|private|protected|internal|static|final|abstract|override|suspend|async|virtual)\s+)+[\w<>\[\],\s]*?\b(\w+)\s*\("),
+    ("function", r"^\s*(?:[\w@]+\s+)*fun\s+(?:<[^>]*>\s*)?(\w+)"),
+]))
+register_language([".c", ".h", ".cc", ".cpp", ".hpp", ".cxx"], _make_regex_extractor([
+    ("struct", r"^\s*(?:typedef\s+)?(?:struct|union|enum|class)\s+(\w+)\s*[{:]"),
+    ("function", r"^[A-Za-z_][\w\s\*&:<>,]*?\b(\w+)\s*\([^;]*\)\s*(?:const\s*)?\{?\s*$"),
+    ("macro", r"^\s*#\s*define\s+(\w+)"),
+]))
+register_language([".rb"], _make_regex_extractor([
+    ("class", r"^\s*(?:class|module)\s+([A-Z]\w*)"),
+    ("function", r"^\s*def\s+(?:self\.)?(\w+[?!=]?)"),
+]))
+register_language([".php"], _make_regex_extractor([
+    ("class", r"^\s*(?:abstract\s+|final\s+)?(?:class|interface|trait)\s+(\w+)"),
+    ("function", r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+(\w+)"),
+]))
+
+
+class SymbolIndex:
+    """In-memory, incrementally updated symbol index of a workspace."""
+
+    def __init__(self, workspace: Path):
+        self.workspace = workspace
+        self._lock = threading.Lock()
+        self._files: dict[str, tuple[int, int, FileSymbols]] = {}  # path -> (mtime_ns, size, symbols)
+        self._definitions: dict[str, list[Symbol]] = {}  # name -> definitions
+        self._referencing_files: dict[str, set[str]] = {}  # name -> paths using it
+
+    def find_definitions(self, name: str, kind: Optional[str] = None) -> list[Symbol]:
+        """Find definitions by name or qualified name (e.g. 'Session.cancel')."""
+        with self._lock:
+            self._refresh()
+            short_name = name.rsplit(".", 1)[-1]
+            candidates = self._definitions.get(short_name, [])
+            if "." in name:
+                candidates = [symbol for symbol in candidates
+                              if symbol.qualified_name == name
+                              or symbol.qualified_name.endswith("." + name)]
+            if kind:
+                return [symbol for symbol in candidates if symbol.kind == kind]
+            definitions = [symbol for symbol in candidates if symbol.kind != _IMPORT_KIND]
+            # Fall back to imports for names defined outside the workspace
+            return definitions or candidates
+
+    def find_references(self, name: str, under: str = "") -> list[tuple[str, int, int]]:
+        """Find the (path, line, column) sites where a name is used.
+
+        Args:
+            name: Symbol name
+            under: Only report sites in this file or directory ("" for all)
+        """
+        with self._lock:
+            self._refresh()
+            short_name = name.rsplit(".", 1)[-1]
+            sites = []
+            for path in self._referencing_files.get(short_name, ()):
+                if under and path != under and not path.startswith(under + "/"):
+                    continue
+                for line, column in self._files[path][2].references.get(short_name, ()):
+                    sites.append((path, line, column))
+            sites.sort()
+            return sites
+
+    def _refresh(self) -> None:
+        """Re-parse files whose mtime/size changed since the last lookup."""
+        current = {}
+        for rel_path, full_path in walk_files(self.workspace, workspace=self.workspace):
+            if os.path.splitext(rel_path)[1].lower() not in _extractors:
+                continue
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            current[rel_path] = (full_path, st.st_mtime_ns, st.st_size)
+
+        for path in [path for path in self._files if path not in current]:
+            self._remove(path)
+        for rel_path, (full_path, mtime_ns, size) in current.items():
+            known = self._files.get(rel_path)
+            if known is not None and known[:2] == (mtime_ns, size):
+                continue
+            self._remove(rel_path)
+            self._add(rel_path, full_path, mtime_ns, size)
+
+    def _add(self, rel_path: str, full_path: str, mtime_ns: int, size: int) -> None:
+        symbols = FileSymbols()
+        if size <= MAX_FILE_BYTES:
+            try:
+                text = file_cache.read_bytes(full_path, evict=False).decode("utf-8", errors="replace")
+                extractor = _extractors[os.path.splitext(rel_path)[1].lower()]
+                symbols = extractor(rel_path, text)
+            except OSError:
+                pass
+        self._files[rel_path] = (mtime_ns, size, symbols)
+        for symbol in symbols.definitions:
+            self._definitions.setdefault(symbol.name, []).append(symbol)
+        for name in symbols.references:
+            self._referencing_files.setdefault(name, set()).add(rel_path)
+
+    def _remove(self, rel_path: str) -> None:
+        known = self._files.pop(rel_path, None)
+        if known is None:
+            return
+        symbols = known[2]
+        for name in {symbol.name for symbol in symbols.definitions}:
+            remaining = [symbol for symbol in self._definitions.get(name, ()) if symbol.path != rel_path]
+            if remaining:
+                self._definitions[name] = remaining
+            else:
+                self._definitions.pop(name, None)
+        for name in symbols.references:
+            paths = self._referencing_files.get(name)
+            if paths is not None:
+                paths.discard(rel_path)
+                if not paths:
+                    del self._referencing_files[name]
+
+
+# Shared indexes: {workspace: SymbolIndex}
+_indexes: dict[Path, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(workspace: Path) -> SymbolIndex:
+    """Return the shared symbol index of a workspace."""
+    with _indexes_lock:
+        index = _indexes.get(workspace)
+        if index is None:
+            index = _indexes[workspace] = SymbolIndex(workspace)
+        return index
+
+
+def _read_line(root: Path, path: str, line: int, cache: dict[str, list[str]]) -> str:
+    """Return a source line (stripped), caching file contents per call."""
+    if path not in cache:
+        try:
+            data = file_cache.read_bytes(root / path)
+            cache[path] = split_lines(data.decode("utf-8", errors="replace"))
+        except OSError:
+            cache[path] = []
+    lines = cache[path]
+    return lines[line - 1].strip()[:200] if 0 < line <= len(lines) else ""
+
+
+@tool
+def find_definition(
+    symbol: Annotated[str, "Symbol name, optionally qualified (e.g. 'execute_tool' or 'Session.add_tool_message')"],
+    kind: Annotated[Optional[str], "Optional kind filter: class, function, method, variable, import, ..."] = None,
+) -> str:
+    """Find where a symbol (class, function, method, variable) is defined.
+
+    Returns:
+        One line per definition: path:line: kind qualified_name followed by the source line.
+    """
+    root = get_workspace_root()
+    try:
+        definitions = get_symbol_index(root).find_definitions(symbol, kind)
+    except Exception as e:
+        return f"Error: {str(e)}"
+    if not definitions:
+        return f"No definition found for '{symbol}'"
+
+    lines_cache: dict[str, list[str]] = {}
+    return "\n".join(
+        f"{d.path}:{d.line}: {d.kind} {d.qualified_name}\n    {_read_line(root, d.path, d.line, lines_cache)}"
+        for d in sorted(definitions, key=lambda d: (d.path, d.line))
+    )
+
+
+@tool
+def find_references(
+    symbol: Annotated[str, "Symbol name to find usages of"],
+    path: Annotated[str, "Only report references in this file or under this directory (relative to project root)"] = ".",
+    max_results: Annotated[int, "Maximum number of references to return"] = 200,
+) -> str:
+    """Find the places where a symbol is used (calls, attribute accesses, imports).
+
+    Returns:
+        One line per reference: path:line:column: source line.
+    """
+    under = posixpath.normpath(Path(path).as_posix()).strip("/")
+    under = "" if under == "." else under
+    root = get_workspace_root()
+    try:
+        sites = get_symbol_index(root).find_references(symbol, under)
+    except Exception as e:
+        return f"Error: {str(e)}"
+    if not sites:
+        return f"No references found for '{symbol}'"
+
+    lines_cache: dict[str, list[str]] = {}
+    output = [
+        f"{site_path}:{line}:{column + 1}: {_read_line(root, site_path, line, lines_cache)}"
+        for site_path, line, column in sites[:max(max_results, 1)]
+    ]
+    if len(sites) > max_results:
+        output.append(f"[{len(sites)} references, showing the first {max_results}]")
+    return "\n".join(output)
@@ -1,54 +1,220 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Sequence
+
+from jsonschema import validators
+from jsonschema.exceptions import SchemaError, best_match
 from langchain_core.messages import ToolCall
 from langchain_core.tools.base import BaseTool
 
-from src.mcp.mcp_tools import get_mcp_tools
+from src.mcp.mcp_tools import get_loaded_mcp_tools, start_mcp_servers
+from src.tools.apply_patch import apply_patch
+from src.tools.artifact_store import read_tool_artifact
 from src.tools.command_tools import run_command, \
     read_command_output, send_command_input
 from src.tools.grep_search import grep_search
 from src.tools.langchain_tools import get_langchain_tools
-from src.tools.replace_file_content import replace_file_content
+from src.tools.replace_file_content import replace_file_content, \
+    multi_replace_file_content
+from src.tools.symbol_index import find_definition, find_references
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of tool registries kept (one per distinct tool list)
+MAX_TOOL_REGISTRIES = 64
+
+# Argument validators by tool: {id(tool): (tool, validator)}
+_validators: dict[int, tuple[BaseTool, Optional[Callable[[dict], Optional[str]]]]] = {}
+# Registries by tool list: {tuple of tool ids: registry}, LRU ordered
+_registries: OrderedDict[tuple[int, ...], "ToolRegistry"] = OrderedDict()
+# Name collisions already reported, so rebuilt registries do not repeat them
+_reported_collisions: set[tuple[str, str, str]] = set()
+
+# Built-in tools, created once so bound models can be reused across turns
+_core_tools: list[BaseTool] = []
+
+
+def get_core_tools() -> list[BaseTool]:
+    """Get the built-in tools."""
+    if not _core_tools:
+        _core_tools.extend([
+            run_command,
+            read_command_output,
+            send_command_input,
+            replace_file_content,
+            multi_replace_file_content,
+            apply_patch,
+            grep_search,
+            find_definition,
+            find_references,
+            read_tool_artifact,
+            *get_langchain_tools(),
+        ])
+    return list(_core_tools)
 
 
 async def get_all_tools() -> list[BaseTool]:
-    """Get all available tools from all sources."""
-    tools: list[BaseTool] = [
-        run_command,
-        read_command_output,
-        send_command_input,
-        replace_file_content,
-        grep_search,
-        *get_langchain_tools(),
-    ]
-
-    mcp_tools = await get_mcp_tools()
-    tools.extend(mcp_tools)
-
-    return tools
-
-async def execute_tool(tools: list[BaseTool], tool_call: ToolCall) -> str:
+    """Get all available tools from all sources.
+
+    Returns immediately with the built-in tools and the tools of the MCP
+    servers connected so far. Servers still connecting add their tools to
+    later calls, so call this once per model turn. Tools whose name is
+    already taken (by a built-in or an earlier MCP tool) are left out.
+    """
+    start_mcp_servers()
+    return get_tool_registry(get_core_tools() + get_loaded_mcp_tools()).tools()
+
+
+def _tool_source(tool: BaseTool) -> str:
+    """Describe where a tool comes from, for collision reports."""
+    server = (tool.metadata or {}).get("mcp_server")
+    return f"MCP server '{server}'" if server else "the built-in tools"
+
+
+def _compile_validator(tool: BaseTool) -> Optional[Callable[[dict], Optional[str]]]:
+    """Build the argument validator of a tool.
+
+    Tools with a JSON schema (MCP tools) are not validated by LangChain, so
+    their schema is compiled once into a jsonschema validator. Tools with a
+    Pydantic schema are validated by the tool itself.
+
+    Returns:
+        A function returning an error message for invalid arguments (None if
+        they are valid), or None if there is nothing to check.
+    """
+    schema = tool.args_schema
+    if not isinstance(schema, dict):
+        return None
+    validator_class = validators.validator_for(schema)
+    try:
+        validator_class.check_schema(schema)
+    except SchemaError as e:
+        logger.warning("Not validating arguments of tool '%s': invalid schema: %s",
+                       tool.name, e.message)
+        return None
+    validator = validator_class(schema)
+
+    def validate(args: dict) -> Optional[str]:
+        error = best_match(validator.iter_errors(args))
+        if error is None:
+            return None
+        location = "/".join(str(part) for part in error.absolute_path)
+        return f"{location}: {error.message}" if location else error.message
+
+    return validate
+
+
+class ToolRegistry:
+    """Tools by name, with cached argument validators.
+
+    Tools are registered in priority order (built-in tools first). A tool
+    whose name is already taken by another tool is skipped and the
+    collision is logged.
+    """
+
+    def __init__(self, tools: Sequence[BaseTool] = ()):
+        self._tools: dict[str, BaseTool] = {}
+        for tool in tools:
+            self.register(tool)
+
+    def register(self, tool: BaseTool) -> bool:
+        """Add a tool.
+
+        Returns:
+            False if another tool already has the same name.
+        """
+        existing = self._tools.get(tool.name)
+        if existing is not None and existing is not tool:
+            collision = (tool.name, _tool_source(existing), _tool_source(tool))
+            if collision not in _reported_collisions:
+                _reported_collisions.add(collision)
+                logger.warning("Tool name collision: '%s' from %s is ignored, "
+                               "the name is already used by %s",
+                               tool.name, collision[2], collision[1])
+            return False
+        self._tools[tool.name] = tool
+        return True
+
+    def get(self, name: str) -> Optional[BaseTool]:
+        return self._tools.get(name)
+
+    def tools(self) -> list[BaseTool]:
+        """The registered tools, in registration order."""
+        return list(self._tools.values())
+
+    def validate(self, tool: BaseTool, args: dict) -> Optional[str]:
+        """Check tool arguments against the tool's schema.
+
+        Returns:
+            An error message, or None if the arguments are valid.
+        """
+        entry = _validators.get(id(tool))
+        if entry is None or entry[0] is not tool:
+            entry = (tool, _compile_validator(tool))
+            _validators[id(tool)] = entry
+        validator = entry[1]
+        return validator(args) if validator is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __iter__(self) -> Iterator[BaseTool]:
+        return iter(self._tools.values())
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+
+def get_tool_registry(tools: Sequence[BaseTool]) -> ToolRegistry:
+    """Return the registry of a tool list, reused while the list is unchanged."""
+    key = tuple(id(tool) for tool in tools)
+    registry = _registries.get(key)
+    if registry is None:
+        registry = ToolRegistry(tools)
+        _registries[key] = registry
+        if len(_registries) > MAX_TOOL_REGISTRIES:
+            _registries.popitem(last=False)
+    else:
+        _registries.move_to_end(key)
+    return registry
+
+
+async def execute_tool(tools: ToolRegistry, tool_call: ToolCall) -> str:
     """Execute a tool call and return the result."""
     tool_name = tool_call["name"]
     tool_args = tool_call["args"]
+    logger.debug("Executing tool: %s, tool_args: %s", tool_name,
+                 _TruncatedArgs(tool_args))
 
-    truncated_args = _truncate_args_for_print(tool_args)
-    print(f"Executing tool: {tool_name}, tool_args: {truncated_args}")
-
-    # Find the tool by name
-    tool = next((t for t in tools if t.name == tool_name), None)
-
+    tool = tools.get(tool_name)
     if tool is None:
         return f"Error: Unknown tool '{tool_name}'"
 
+    error = tools.validate(tool, tool_args)
+    if error is not None:
+        return f"Error: Invalid arguments for tool '{tool_name}': {error}"
+
     # Execute the tool and return the result
     try:
-        result = await tool.ainvoke(tool_args)
-        print(f"\n📦 Tool result:\n{str(result)[:100]}...")
-        return str(result)
+        result = str(await tool.ainvoke(tool_args))
+        logger.debug("Tool result of %s: %.100s...", tool_name, result)
+        return result
     except Exception as e:
-        print(f"Error executing tool '{tool_name}': {str(e)}")
+        logger.warning("Error executing tool '%s': %s", tool_name, e)
         return f"Error: {str(e)}"
 
 
+class _TruncatedArgs:
+    """Tool arguments, truncated only if a log record is emitted."""
+    __slots__ = ("args",)
+
+    def __init__(self, args: dict):
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(_truncate_args_for_print(self.args))
+
+
 def _truncate_args_for_print(args: dict, max_length: int = 100) -> dict:
     """Truncate long string values in args for printing purposes."""
     truncated = {}
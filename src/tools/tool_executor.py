@@ -0,0 +1,150 @@
+"""Concurrent execution of the tool calls returned in a single model turn.
+
+Tool calls are classified as read-only or mutating. Read-only calls and
+calls that touch different files run in parallel (bounded by a semaphore),
+while calls that conflict keep the order the model emitted them in.
+Results are always returned in the original order so the ToolMessages
+appended to the history line up with the AIMessage tool calls.
+"""
+import asyncio
+import posixpath
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.messages import ToolCall
+
+from src.tools.tool import ToolRegistry, execute_tool
+
+# Maximum number of tool calls running at the same time
+MAX_CONCURRENT_TOOL_CALLS = 8
+
+# Tools that never modify the workspace or any process state
+READ_ONLY_TOOLS = {
+    "read_file",
+    "list_directory",
+    "file_search",
+    "grep_search",
+    "find_definition",
+    "find_references",
+    "read_tool_artifact",
+    "search_tools",
+}
+
+# Mutating tools whose effect is limited to the paths in their arguments
+PATH_SCOPED_TOOLS = {
+    "write_file",
+    "copy_file",
+    "move_file",
+    "file_delete",
+    "replace_file_content",
+    "multi_replace_file_content",
+}
+
+# Argument names that carry a workspace path
+PATH_ARGS = (
+    "target_file",
+    "file_path",
+    "path",
+    "dir_path",
+    "source_path",
+    "destination_path",
+    "new_path",
+)
+
+# Marker for calls whose footprint is unknown (e.g. run_command, MCP tools)
+_WHOLE_WORKSPACE = ""
+
+
+def _normalize_path(path: str) -> str:
+    """Normalize a relative workspace path for overlap checks."""
+    normalized = posixpath.normpath(str(path).replace("\\", "/")).strip("/")
+    return "" if normalized == "." else normalized
+
+
+def _paths_overlap(a: str, b: str) -> bool:
+    """Return True if one path is equal to, or contains, the other."""
+    if a == _WHOLE_WORKSPACE or b == _WHOLE_WORKSPACE:
+        return True
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def _call_footprint(tool_call: ToolCall) -> tuple[bool, set[str]]:
+    """Classify a tool call.
+
+    Returns:
+        (read_only, paths): paths is the set of workspace paths the call
+        touches, or {_WHOLE_WORKSPACE} if it cannot be determined.
+    """
+    read_only = tool_call["name"] in READ_ONLY_TOOLS
+    args = tool_call.get("args") or {}
+    paths = {
+        _normalize_path(args[key])
+        for key in PATH_ARGS
+        if isinstance(args.get(key), str)
+    }
+    if not paths:
+        # read tools default to the project root, others are unknown
+        paths = {_WHOLE_WORKSPACE}
+    if not read_only and tool_call["name"] not in PATH_SCOPED_TOOLS:
+        # Commands and MCP tools may touch anything
+        paths = {_WHOLE_WORKSPACE}
+    return read_only, paths
+
+
+def _conflicts(a: tuple[bool, set[str]], b: tuple[bool, set[str]]) -> bool:
+    """Return True if two calls must not run concurrently."""
+    a_read_only, a_paths = a
+    b_read_only, b_paths = b
+    if a_read_only and b_read_only:
+        return False
+    return any(_paths_overlap(x, y) for x in a_paths for y in b_paths)
+
+
+async def execute_tool_calls(
+        tools: ToolRegistry,
+        tool_calls: list[ToolCall],
+        run_tool: Optional[Callable[[ToolCall], Awaitable[str]]] = None,
+        max_concurrency: int = MAX_CONCURRENT_TOOL_CALLS,
+) -> list[str]:
+    """Execute the tool calls of one model turn concurrently where safe.
+
+    Args:
+        tools: Registry of the available tools
+        tool_calls: Tool calls in the order the model emitted them
+        run_tool: Optional coroutine that executes a single call; defaults
+            to execute_tool. Callers use it to wrap progress notifications.
+        max_concurrency: Maximum number of calls running at once
+
+    Returns:
+        The result of each call, in the same order as tool_calls.
+    """
+    if run_tool is None:
+        async def run_tool(tool_call: ToolCall) -> str:
+            return await execute_tool(tools, tool_call)
+
+    if len(tool_calls) <= 1:
+        return [await run_tool(tool_call) for tool_call in tool_calls]
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    footprints = [_call_footprint(tool_call) for tool_call in tool_calls]
+    tasks: list[asyncio.Task] = []
+
+    async def _run(index: int, dependencies: list[asyncio.Task]) -> str:
+        # Wait for every earlier call this one conflicts with
+        if dependencies:
+            await asyncio.wait(dependencies)
+        async with semaphore:
+            return await run_tool(tool_calls[index])
+
+    for index in range(len(tool_calls)):
+        dependencies = [
+            tasks[earlier]
+            for earlier in range(index)
+            if _conflicts(footprints[earlier], footprints[index])
+        ]
+        tasks.append(asyncio.create_task(_run(index, dependencies)))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [
+        f"Error: {result}" if isinstance(result, BaseException) else result
+        for result in results
+    ]
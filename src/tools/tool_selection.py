@@ -0,0 +1,232 @@
+"""Per-turn selection of the tools bound to the model.
+
+Every bound tool's schema is sent with every request, and a few MCP servers
+can contribute more schema tokens than the conversation itself. When there
+are many unpinned tools, each session binds only:
+- the pinned built-in tools,
+- the tools most relevant to the user's prompt (BM25 over tool names,
+  descriptions and argument names),
+- the tools it called recently (taken from the history),
+- the tools the model found with the search_tools escape hatch.
+
+The subset is recomputed when a new user turn starts (start_turn) and only
+grows during the tool loop of the turn, so the bound model (and the provider's
+prompt cache of the tool definitions) is reused until the subset changes.
+"""
+import json
+import math
+import re
+import sys
+from collections import Counter
+from typing import Annotated, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.tools import tool
+from langchain_core.tools.base import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.tools.tool import get_core_tools
+from src.utils.prompt_compaction import CHARS_PER_TOKEN
+
+# Select tools only when there are more unpinned tools than this
+TOOL_SELECTION_THRESHOLD = 24
+
+# Maximum number of tools selected by relevance to the prompt
+MAX_RELEVANT_TOOLS = 12
+
+# Number of most recently called tools that stay bound
+MAX_RECENT_TOOLS = 8
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words that carry no signal for matching tools
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or",
+    "please", "the", "this", "to", "use", "what", "with", "you",
+}
+
+
+def _tokenize(text: str) -> list[str]:
+    """Lowercase words of a text, splitting snake_case and camelCase."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower())
+            if word not in _STOP_WORDS]
+
+
+def _tool_document(tool: BaseTool) -> list[str]:
+    """Terms a tool is matched on; the name counts twice."""
+    args = " ".join(tool.args) if isinstance(tool.args, dict) else ""
+    return _tokenize(f"{tool.name} {tool.name} {tool.description} {args}")
+
+
+def _schema_tokens(tool: BaseTool) -> int:
+    """Estimate the tokens a tool's schema adds to every request."""
+    return len(json.dumps(convert_to_openai_tool(tool))) // CHARS_PER_TOKEN
+
+
+class _BM25Index:
+    """BM25 ranking of a fixed set of tools."""
+
+    def __init__(self, tools: Sequence[BaseTool]):
+        self.tools = list(tools)
+        self._term_counts = [Counter(_tool_document(t)) for t in self.tools]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = sum(self._lengths) / len(self.tools) if self.tools else 0.0
+        document_frequency = Counter(term for counts in self._term_counts for term in counts)
+        n = len(self.tools)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+                     for term, df in document_frequency.items()}
+
+    def search(self, query: str, limit: int) -> list[BaseTool]:
+        """Return up to `limit` tools matching the query, best first."""
+        terms = set(_tokenize(query)) & self._idf.keys()
+        if not terms:
+            return []
+        scored = []
+        for index, counts in enumerate(self._term_counts):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[index] / self._average_length)
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.tools[index] for _, index in scored[:limit]]
+
+
+def _recent_tool_names(messages: Sequence[BaseMessage], limit: int) -> list[str]:
+    """Names of the most recently called tools in a history, newest first."""
+    names: list[str] = []
+    for message in reversed(messages):
+        if isinstance(message, AIMessage):
+            for tool_call in message.tool_calls:
+                if tool_call["name"] not in names:
+                    names.append(tool_call["name"])
+                    if len(names) == limit:
+                        return names
+    return names
+
+
+class ToolSelector:
+    """Chooses the tools bound to the model for one conversation."""
+
+    def __init__(self):
+        self._tools: list[BaseTool] = []
+        self._index: Optional[_BM25Index] = None
+        self._index_key: tuple = ()
+        self._schema_tokens: dict[tuple[str, int], int] = {}
+        self._query = ""
+        self._turn = 0  # Incremented by start_turn
+        self._selected_turn = -1  # Turn the relevance selection was made for
+        self._selected: set[str] = set()
+        self._discovered: set[str] = set()
+        self._bound_names: tuple[str, ...] = ()
+        self.search_tool = self._create_search_tool()
+
+    def get_tools(self, tools: Sequence[BaseTool]) -> list[BaseTool]:
+        """All tools the model may call, including search_tools."""
+        return [*tools, self.search_tool]
+
+    def start_turn(self, prompt: str) -> None:
+        """Start a user turn; the next select() starts over from this prompt.
+
+        Keyed on the turn rather than the last HumanMessage, which mid-turn
+        compaction can fold into the summary.
+        """
+        self._turn += 1
+        self._query = prompt
+
+    def select(self, tools: Sequence[BaseTool],
+               messages: Sequence[BaseMessage]) -> list[BaseTool]:
+        """Return the tools to bind for the next request.
+
+        Args:
+            tools: All available tools (built-in and MCP).
+            messages: The conversation history (recently called tools stay bound).
+        """
+        self._tools = list(tools)
+        pinned = {t.name for t in get_core_tools()}
+        unpinned = [t for t in tools if t.name not in pinned]
+        if len(unpinned) <= TOOL_SELECTION_THRESHOLD:
+            return list(tools)
+
+        if self._selected_turn != self._turn:
+            # New turn: start over from relevance, usage and nothing discovered
+            self._selected_turn = self._turn
+            self._discovered.clear()
+            self._selected = {t.name for t in self._get_index(unpinned).search(
+                self._query, MAX_RELEVANT_TOOLS)}
+        self._selected.update(_recent_tool_names(messages, MAX_RECENT_TOOLS))
+        self._selected.update(self._discovered)
+
+        selected = [t for t in tools if t.name in pinned or t.name in self._selected]
+        selected.append(self.search_tool)
+        bound_names = tuple(t.name for t in selected)
+        if bound_names != self._bound_names:
+            self._bound_names = bound_names
+            print(self._format_reduction(tools, selected), file=sys.stderr)
+        return selected
+
+    def _get_index(self, tools: list[BaseTool]) -> _BM25Index:
+        """BM25 index of the unpinned tools, rebuilt when they change."""
+        key = tuple((t.name, id(t)) for t in tools)
+        if self._index is None or key != self._index_key:
+            self._index = _BM25Index(tools)
+            self._index_key = key
+        return self._index
+
+    def _count_schema_tokens(self, tools: Sequence[BaseTool]) -> int:
+        total = 0
+        for t in tools:
+            key = (t.name, id(t))
+            if key not in self._schema_tokens:
+                self._schema_tokens[key] = _schema_tokens(t)
+            total += self._schema_tokens[key]
+        return total
+
+    def _format_reduction(self, tools: Sequence[BaseTool],
+                          selected: Sequence[BaseTool]) -> str:
+        """Describe the schema tokens saved per request by the selection."""
+        all_tokens = self._count_schema_tokens(tools)
+        selected_tokens = self._count_schema_tokens(selected)
+        saved = 1 - selected_tokens / all_tokens if all_tokens else 0.0
+        return (f"Tool selection: {len(selected)}/{len(tools)} tools bound, "
+                f"~{selected_tokens} schema input tokens per request instead of "
+                f"~{all_tokens} ({saved:.0%} fewer)")
+
+    def search(self, query: str, max_results: int) -> str:
+        """Find tools by keywords and bind them from the next request on."""
+        pinned = {t.name for t in get_core_tools()}
+        unpinned = [t for t in self._tools if t.name not in pinned]
+        matches = self._get_index(unpinned).search(query, max_results)
+        if not matches:
+            return f"No tools found for '{query}'"
+        self._discovered.update(t.name for t in matches)
+        return "Found tools (available from your next call):\n" + "\n".join(
+            f"- {t.name}: {t.description.strip().splitlines()[0] if t.description.strip() else ''}"
+            for t in matches)
+
+    def _create_search_tool(self) -> BaseTool:
+        selector = self
+
+        @tool
+        def search_tools(
+            query: Annotated[str, "Keywords describing the capability you need (e.g. 'create github issue')"],
+            max_results: Annotated[int, "Maximum number of tools to return"] = 8,
+        ) -> str:
+            """Search all available tools, including ones not currently offered to you.
+
+            Only the tools relevant to the conversation are offered. Use this when
+            none of them can do what you need; matching tools become callable.
+
+            Returns:
+                One line per matching tool: name: first line of its description.
+            """
+            return selector.search(query, max_results)
+
+        return search_tools
@@ -0,0 +1,560 @@
+"""Persistent trigram index that narrows grep_search to candidate files.
+
+The index lives in `.code-buddy/search_index.sqlite` inside the workspace.
+It maps every (ASCII case-folded) byte trigram to the IDs of the files
+containing it, stored as one posting list per trigram. It is built in the
+background on first use; until then, and for directories it does not
+cover (ignored or vendored ones), grep_search scans without it.
+
+Queries never walk the workspace. They re-index the files written through
+the file cache, and list again the directories whose mtime changed (files
+created, deleted or renamed). In-place edits made by other programs are
+picked up by a full background rescan, started at most every
+RESCAN_INTERVAL seconds.
+
+Regex queries are reduced to the trigrams of the literal runs every match
+must contain; only files whose posting lists contain all of them are
+scanned. Patterns without such literals fall back to a full scan.
+
+Changed files keep their old postings (extra candidates are harmless, the
+scanner verifies every match); the index is rebuilt once too many
+entries are stale.
+"""
+import array
+import fnmatch
+import os
+import re
+import re._constants as sre_constants
+import re._parser as sre_parser
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from src.tools.file_cache import add_write_listener
+from src.tools.search_engine import MAX_FILE_BYTES, BINARY_SNIFF_BYTES, \
+    SEARCH_WORKERS, scan_directory, walk_tree
+
+# Location of the index database, relative to the workspace
+INDEX_PATH = Path(".code-buddy") / "search_index.sqlite"
+
+# Number of files indexed before their postings are flushed to disk
+INDEX_BATCH_SIZE = 2000
+
+# Rebuild from scratch once this fraction of indexed files changed
+MAX_STALE_FRACTION = 0.25
+
+# Minimum time between full background rescans of the workspace (seconds)
+RESCAN_INTERVAL = 30.0
+
+# Queries wait at most this long for a background update before searching
+# without the index (seconds)
+QUERY_LOCK_TIMEOUT = 0.5
+
+# SQLite limit on bound parameters per statement
+_SQL_BATCH = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER PRIMARY KEY,
+    file_ids BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+@dataclass
+class IndexStats:
+    """Build, size and query statistics of a trigram index."""
+    files: int = 0
+    trigrams: int = 0
+    size_bytes: int = 0
+    stale_files: int = 0
+    build_seconds: float = 0.0  # Last full build
+    update_seconds: float = 0.0  # Last incremental update
+    updated_files: int = 0  # Files re-indexed by the last update
+    scan_seconds: float = 0.0  # Last background walk of the workspace
+    refresh_seconds: float = 0.0  # Change check of the last query
+    query_seconds: float = 0.0  # Last candidate lookup
+    candidates: int = 0  # Candidate files returned by the last lookup
+
+
+def _stat_file(item: tuple[str, str]) -> Optional[tuple[str, str, int, int]]:
+    """Return (relative path, full path, mtime_ns, size), or None if it is gone."""
+    try:
+        st = os.stat(item[1])
+    except OSError:
+        return None
+    return item[0], item[1], st.st_mtime_ns, st.st_size
+
+
+def _directory_mtime(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _parent(rel_path: str) -> str:
+    return rel_path.rpartition("/")[0]
+
+
+def _file_trigrams(path: str) -> Optional[set[int]]:
+    """Return the case-folded trigrams of a file, or None if it is not indexable."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > MAX_FILE_BYTES:
+                return None
+            data = f.read()
+    except OSError:
+        return None
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    data = data.lower()
+    return {(a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+def _literal_runs(parsed, case_insensitive: bool) -> Optional[list[list[str]]]:
+    """Extract the literal runs that every match of a parsed regex contains.
+
+    Returns:
+        A list of alternatives, each a list of literal strings that must all
+        occur, or None if some alternative has no usable literal.
+    """
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] == sre_constants.BRANCH:
+        alternatives = []
+        for branch in items[0][1][1]:
+            runs = _literal_runs(branch, case_insensitive)
+            if runs is None:
+                return None
+            alternatives.extend(runs)
+        return alternatives
+
+    runs: list[str] = []
+    current: list[str] = []
+
+    def end_run():
+        if len(current) >= 3:
+            runs.append("".join(current))
+        current.clear()
+
+    for op, value in items:
+        if op == sre_constants.LITERAL:
+            char = chr(value)
+            if case_insensitive and not char.isascii():
+                end_run()
+                continue
+            current.append(char)
+        elif op == sre_constants.SUBPATTERN and value[3] is not None:
+            inner = list(value[3])
+            if all(inner_op == sre_constants.LITERAL for inner_op, _ in inner):
+                current.extend(chr(inner_value) for _, inner_value in inner)
+            else:
+                end_run()
+                nested = _literal_runs(value[3], case_insensitive)
+                if nested is not None and len(nested) == 1:
+                    runs.extend(nested[0])
+        elif op in (sre_constants.AT,):
+            # Anchors do not consume characters
+            continue
+        else:
+            end_run()
+    end_run()
+    return [runs] if runs else None
+
+
+def _pattern_trigrams(pattern: str, case_insensitive: bool) -> Optional[list[set[int]]]:
+    """Return, per alternative, the trigrams every match must contain."""
+    flags = re.IGNORECASE if case_insensitive else 0
+    try:
+        parsed = sre_parser.parse(pattern, flags)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        case_insensitive = True
+
+    alternatives = _literal_runs(parsed, case_insensitive)
+    if not alternatives:
+        return None
+
+    result = []
+    for runs in alternatives:
+        trigrams = set()
+        for run in runs:
+            data = run.encode("utf-8").lower()
+            trigrams.update((a << 16) | (b << 8) | c
+                            for a, b, c in zip(data, data[1:], data[2:]))
+        if not trigrams:
+            return None
+        result.append(trigrams)
+    return result
+
+
+class TrigramIndex:
+    """On-disk trigram index of a workspace."""
+
+    def __init__(self, workspace: Path, index_path: Optional[Path] = None):
+        self.workspace = workspace
+        self.index_path = index_path or workspace / INDEX_PATH
+        self.stats = IndexStats()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._files: dict[str, tuple[int, int, int]] = {}  # path -> (id, mtime_ns, size)
+        self._paths: dict[int, str] = {}  # id -> path
+        self._dirs: dict[str, Optional[int]] = {}  # walked directory -> mtime_ns
+        self._resolved_workspace = workspace.resolve()
+        self._written: set[str] = set()  # files written through the file cache
+        self._written_lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._scanning = False
+        self._last_scan = float("-inf")
+        add_write_listener(self._on_write)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the first background scan finished."""
+        return bool(self._dirs)
+
+    def candidates(
+        self,
+        pattern: str,
+        case_insensitive: bool,
+        search_path: Path,
+        include: Optional[str] = None,
+    ) -> Optional[list[tuple[str, str]]]:
+        """Return the files under search_path that may match the pattern.
+
+        Returns:
+            Sorted (relative path, full path) pairs, or None if a full scan is
+            needed: the pattern cannot be narrowed, the index is still
+            building or busy, or it does not cover search_path.
+        """
+        required = _pattern_trigrams(pattern, case_insensitive)
+        if required is None:
+            return None
+
+        try:
+            rel_root = search_path.resolve().relative_to(self._resolved_workspace).as_posix()
+        except ValueError:
+            return None
+        rel_root = "" if rel_root == "." else rel_root
+        prefix = rel_root + "/" if rel_root else ""
+
+        self._schedule_scan()
+        if not self._lock.acquire(timeout=QUERY_LOCK_TIMEOUT):
+            # A background update is writing the index
+            return None
+        try:
+            started = time.perf_counter()
+            self._refresh()
+            refreshed = time.perf_counter()
+            if rel_root not in self._dirs:
+                # Not built yet, or an ignored/vendored directory the index
+                # never walked: only a full scan sees its files
+                return None
+
+            file_ids: set[int] = set()
+            for trigrams in required:
+                file_ids |= self._lookup(trigrams)
+
+            files = []
+            for file_id in file_ids:
+                path = self._paths.get(file_id)
+                if path is None or not path.startswith(prefix):
+                    continue
+                if include and not fnmatch.fnmatch(path.rsplit("/", 1)[-1], include) \
+                        and not fnmatch.fnmatch(path, include):
+                    continue
+                files.append((path, str(self.workspace / path)))
+            files.sort()
+
+            self.stats.refresh_seconds = refreshed - started
+            self.stats.query_seconds = time.perf_counter() - refreshed
+            self.stats.candidates = len(files)
+        finally:
+            self._lock.release()
+        return files
+
+    def get_stats(self) -> dict:
+        """Return the index statistics as a dict."""
+        # Not locked: a background build may hold the lock for a long time
+        try:
+            self.stats.size_bytes = self.index_path.stat().st_size
+        except OSError:
+            self.stats.size_bytes = 0
+        return asdict(self.stats)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._connection.executescript(_SCHEMA)
+            self._files = {
+                path: (file_id, mtime_ns, size)
+                for file_id, path, mtime_ns, size
+                in self._connection.execute("SELECT id, path, mtime_ns, size FROM files")
+            }
+            self._paths = {file_id: path for path, (file_id, _, _) in self._files.items()}
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'stale_files'").fetchone()
+            self.stats.stale_files = row[0] if row else 0
+            self.stats.files = len(self._files)
+        return self._connection
+
+    def _lookup(self, trigrams: set[int]) -> set[int]:
+        """Intersect the posting lists of the given trigrams."""
+        db = self._db()
+        postings = []
+        trigram_list = list(trigrams)
+        for start in range(0, len(trigram_list), _SQL_BATCH):
+            batch = trigram_list[start:start + _SQL_BATCH]
+            rows = db.execute(
+                f"SELECT file_ids FROM postings WHERE trigram IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            postings.extend(array.array("I", blob) for (blob,) in rows)
+        if len(postings) < len(trigrams):
+            # Some trigram occurs in no file at all
+            return set()
+
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def _on_write(self, path: str) -> None:
+        """Remember a file written through the file cache."""
+        try:
+            rel_path = Path(path).relative_to(self._resolved_workspace).as_posix()
+        except ValueError:
+            return
+        with self._written_lock:
+            self._written.add(rel_path)
+
+    def _schedule_scan(self) -> None:
+        """Start a background rescan unless one ran within RESCAN_INTERVAL."""
+        with self._scan_lock:
+            if self._scanning or time.monotonic() - self._last_scan < RESCAN_INTERVAL:
+                return
+            self._scanning = True
+        threading.Thread(target=self._scan, name="trigram-index-scan", daemon=True).start()
+
+    def _scan(self) -> None:
+        """Walk and stat the whole workspace, then bring the index up to date."""
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+                files, directories = walk_tree(self.workspace, executor=executor,
+                                               workspace=self.workspace)
+                current = {entry[0]: entry[1:]
+                           for entry in executor.map(_stat_file, files, chunksize=256)
+                           if entry is not None}
+            self.stats.scan_seconds = time.perf_counter() - started
+            with self._lock:
+                self._db()
+                deleted = [path for path in self._files if path not in current]
+                self._update(current, deleted, full_scan=True)
+                # Changes made during the walk show up as newer directory
+                # mtimes and are picked up by the next query
+                self._dirs = {rel_dir: mtime_ns for rel_dir, _, mtime_ns in directories}
+        except Exception as e:
+            print(f"Failed to update search index of {self.workspace}: {e}",
+                  file=sys.stderr)
+        finally:
+            with self._scan_lock:
+                self._scanning = False
+                self._last_scan = time.monotonic()
+
+    def _refresh(self) -> None:
+        """Pick up changes since the last query without walking the workspace."""
+        with self._written_lock:
+            written, self._written = self._written, set()
+        current: dict[str, tuple[str, int, int]] = {}
+        deleted: set[str] = set()
+        # New files are found through their directory's mtime
+        for entry in map(_stat_file, ((path, str(self.workspace / path))
+                                      for path in written if path in self._files)):
+            if entry is not None:
+                current[entry[0]] = entry[1:]
+
+        changed_dirs = sorted(
+            rel_dir for rel_dir, mtime_ns in self._dirs.items()
+            if _directory_mtime(self.workspace / rel_dir) != mtime_ns)
+        for rel_dir in changed_dirs:
+            if rel_dir not in self._dirs:
+                # Removed together with its parent
+                continue
+            mtime_ns, files, subdirectories = scan_directory(
+                self.workspace / rel_dir, self.workspace)
+            if mtime_ns is None and rel_dir:
+                self._forget_directory(rel_dir, deleted)
+                continue
+            self._dirs[rel_dir] = mtime_ns
+
+            listed = {rel_path for rel_path, _ in files}
+            deleted.update(path for path in self._files
+                           if _parent(path) == rel_dir and path not in listed)
+            for entry in map(_stat_file, files):
+                if entry is not None:
+                    current[entry[0]] = entry[1:]
+
+            listed_dirs = {rel_path for rel_path, _ in subdirectories}
+            for child in [d for d in self._dirs
+                          if d and _parent(d) == rel_dir and d not in listed_dirs]:
+                self._forget_directory(child, deleted)
+            for child, full_path in subdirectories:
+                if child in self._dirs:
+                    continue
+                new_files, new_dirs = walk_tree(Path(full_path), workspace=self.workspace)
+                self._dirs.update((d, mtime) for d, _, mtime in new_dirs)
+                for entry in map(_stat_file, new_files):
+                    if entry is not None:
+                        current[entry[0]] = entry[1:]
+
+        if current or deleted:
+            self._update(current, list(deleted - current.keys()))
+
+    def _forget_directory(self, rel_dir: str, deleted: set[str]) -> None:
+        """Drop a removed directory and mark the files below it as deleted."""
+        prefix = rel_dir + "/"
+        for path in [d for d in self._dirs if d == rel_dir or d.startswith(prefix)]:
+            del self._dirs[path]
+        deleted.update(path for path in self._files if path.startswith(prefix))
+
+    def _update(self, current: dict[str, tuple[str, int, int]], deleted: list[str],
+                full_scan: bool = False) -> None:
+        """Re-index the files of `current` whose mtime/size changed and drop `deleted`.
+
+        Args:
+            current: Files seen by this refresh: path -> (full path, mtime_ns, size).
+            deleted: Indexed files that no longer exist.
+            full_scan: Whether `current` lists the whole workspace, which
+                allows rebuilding from scratch once too many entries are stale.
+        """
+        db = self._db()
+        started = time.perf_counter()
+        full_build = not self._files
+
+        changed = [
+            (rel_path, full_path, mtime_ns, size)
+            for rel_path, (full_path, mtime_ns, size) in current.items()
+            if self._files.get(rel_path, (None, None, None))[1:] != (mtime_ns, size)
+        ]
+        deleted = [path for path in deleted if path in self._files]
+        modified = sum(1 for rel_path, *_ in changed if rel_path in self._files)
+        if not changed and not deleted:
+            # Nothing to write; the common case for back-to-back queries
+            return
+
+        stale = self.stats.stale_files + modified + len(deleted)
+        if full_scan and self._files and stale > MAX_STALE_FRACTION * len(self._files):
+            # Too many stale postings: rebuild from scratch
+            db.executescript("DELETE FROM files; DELETE FROM postings; DELETE FROM meta;")
+            self._files, self._paths = {}, {}
+            changed = [(rel_path, *info) for rel_path, info in current.items()]
+            deleted, stale, full_build = [], 0, True
+
+        for path in deleted:
+            file_id = self._files.pop(path)[0]
+            self._paths.pop(file_id, None)
+        if deleted:
+            self._executemany_batched(
+                "DELETE FROM files WHERE path IN ({})", deleted)
+
+        if changed:
+            with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+                for start in range(0, len(changed), INDEX_BATCH_SIZE):
+                    self._index_batch(changed[start:start + INDEX_BATCH_SIZE], executor)
+
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stale_files', ?)", (stale,))
+        db.commit()
+
+        elapsed = time.perf_counter() - started
+        self.stats.files = len(self._files)
+        self.stats.stale_files = stale
+        self.stats.trigrams = db.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        self.stats.updated_files = len(changed)
+        if full_build:
+            self.stats.build_seconds = elapsed
+        else:
+            self.stats.update_seconds = elapsed
+
+    def _index_batch(self, batch: list[tuple[str, str, int, int]],
+                     executor: ThreadPoolExecutor) -> None:
+        """Index a batch of new or changed files and merge their postings."""
+        db = self._db()
+        new_postings: dict[int, array.array] = {}
+        trigram_sets = executor.map(lambda item: _file_trigrams(item[1]), batch, chunksize=16)
+
+        for (rel_path, _, mtime_ns, size), trigrams in zip(batch, trigram_sets):
+            known = self._files.get(rel_path)
+            if known is None:
+                file_id = db.execute(
+                    "INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                    (rel_path, mtime_ns, size),
+                ).lastrowid
+            else:
+                file_id = known[0]
+                db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?",
+                           (mtime_ns, size, file_id))
+            self._files[rel_path] = (file_id, mtime_ns, size)
+            self._paths[file_id] = rel_path
+            for trigram in trigrams or ():
+                posting = new_postings.get(trigram)
+                if posting is None:
+                    new_postings[trigram] = posting = array.array("I")
+                posting.append(file_id)
+
+        # Merge with the stored posting lists
+        trigram_list = list(new_postings)
+        for start in range(0, len(trigram_list), _SQL_BATCH):
+            keys = trigram_list[start:start + _SQL_BATCH]
+            rows = db.execute(
+                f"SELECT trigram, file_ids FROM postings WHERE trigram IN ({','.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+            for trigram, blob in rows:
+                stored = array.array("I", blob)
+                stored.extend(new_postings[trigram])
+                new_postings[trigram] = stored
+            db.executemany(
+                "INSERT OR REPLACE INTO postings (trigram, file_ids) VALUES (?, ?)",
+                ((trigram, new_postings[trigram].tobytes()) for trigram in keys),
+            )
+
+    def _executemany_batched(self, statement: str, values: list) -> None:
+        db = self._db()
+        for start in range(0, len(values), _SQL_BATCH):
+            batch = values[start:start + _SQL_BATCH]
+            db.execute(statement.format(",".join("?" * len(batch))), batch)
+
+
+# Shared indexes: {workspace: TrigramIndex}
+_indexes: dict[Path, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(workspace: Path) -> TrigramIndex:
+    """Return the shared trigram index of a workspace."""
+    with _indexes_lock:
+        index = _indexes.get(workspace)
+        if index is None:
+            index = _indexes[workspace] = TrigramIndex(workspace)
+        return index
@@ -0,0 +1,32 @@
+"""Workspace root of the current session, shared by file and command tools.
+
+The root is stored in a context variable, so concurrent sessions of one
+process (each running in its own asyncio task) see their own root. Tool
+calls inherit it: asyncio tasks and LangChain's executor threads copy the
+context they were started from. Without a session, the process working
+directory is used.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+_workspace_root: ContextVar[Optional[Path]] = ContextVar("workspace_root",
+                                                          default=None)
+
+
+def get_workspace_root() -> Path:
+    """Return the workspace root of the current session."""
+    root = _workspace_root.get()
+    return root if root is not None else Path.cwd()
+
+
+@contextmanager
+def workspace_root(path: Union[str, Path]) -> Iterator[Path]:
+    """Run the enclosed code (and the tool calls it starts) in a workspace."""
+    root = Path(path).resolve()
+    token = _workspace_root.set(root)
+    try:
+        yield root
+    finally:
+        _workspace_root.reset(token)
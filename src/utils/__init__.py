@@ -1,4 +1,16 @@
 """Utility modules for code_buddy."""
-from .prompt_compaction import compact_messages_if_needed
+from .prompt_compaction import (
+    BackgroundCompactor,
+    compact_messages_before_request,
+    compact_messages_if_needed,
+    estimate_tokens,
+    is_context_overflow_error,
+)
 
-__all__ = ["compact_messages_if_needed"]
+__all__ = [
+    "BackgroundCompactor",
+    "compact_messages_before_request",
+    "compact_messages_if_needed",
+    "estimate_tokens",
+    "is_context_overflow_error",
+]
@@ -4,30 +4,181 @@ When the conversation history approaches the context window limit,
 this module compacts older messages into a summary while preserving
 the system prompt and recent messages.
 """
+import asyncio
+import json
+import re
+import sys
 from pathlib import Path
 from typing import Optional
 from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import (
+    AIMessage,
     BaseMessage,
     SystemMessage,
     HumanMessage,
+    ToolMessage,
 )
 
-from src.model import create_model
+from src.model import get_model
 
 # Threshold at which to trigger compaction (80% of context window)
 COMPACTION_THRESHOLD = 0.8
 
+# Threshold at which to start compaction in the background (60% of context window)
+SOFT_COMPACTION_THRESHOLD = 0.6
+
+# Threshold the history is cut down to after the provider rejected a request
+# as too long, which means the local estimate was too low (50% of context window)
+OVERFLOW_RETRY_THRESHOLD = 0.5
+
 # Number of recent messages to preserve (excluding system message)
 RECENT_MESSAGES_TO_KEEP = 10
 
+# Characters kept at each end of a recent message truncated to fit the budget
+MIN_TRUNCATED_CHARS = 1_000
+
+# Maximum characters of conversation text summarized in one LLM call
+SUMMARY_CHUNK_CHARS = 200_000
+
+# Maximum number of chunk summaries generated in parallel
+MAX_PARALLEL_SUMMARIES = 4
+
+# Header of the rolling summary message, e.g. "[CONVERSATION SUMMARY - Previous 42 messages]"
+_SUMMARY_HEADER = re.compile(r"\[CONVERSATION SUMMARY - Previous (\d+) messages\]")
+
+# Average characters per token used by the local estimator
+CHARS_PER_TOKEN = 4
+
+# Fixed per-message overhead (role, separators) in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Key under which the estimated token count is cached on each message
+_TOKEN_ESTIMATE_KEY = "estimated_tokens"
+
+# Provider error messages reporting a request larger than the context window
+_CONTEXT_OVERFLOW_MESSAGE = re.compile(
+    r"prompt is too long|context[ _]length|context window|maximum context"
+    r"|exceeds the maximum number of tokens|input token count.*exceeds"
+    r"|too many (input )?tokens",
+    re.IGNORECASE,
+)
+
+
+def _content_length(content) -> int:
+    """Count the characters of a message content (string or content blocks)."""
+    if isinstance(content, str):
+        return len(content)
+    length = 0
+    for block in content:
+        if isinstance(block, str):
+            length += len(block)
+        elif isinstance(block, dict):
+            text = block.get("text") or block.get("thinking") or block.get("reasoning")
+            length += len(text) if isinstance(text, str) else len(json.dumps(block, default=str))
+    return length
+
+
+def estimate_message_tokens(message: BaseMessage) -> int:
+    """Estimate the token count of a single message.
+
+    The estimate is cached in the message's response_metadata so every
+    message is only measured once.
+    """
+    cached = message.response_metadata.get(_TOKEN_ESTIMATE_KEY)
+    if cached is not None:
+        return cached
+
+    length = _content_length(message.content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        length += len(json.dumps(message.tool_calls, default=str))
+    tokens = length // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+    message.response_metadata[_TOKEN_ESTIMATE_KEY] = tokens
+    return tokens
+
+
+def estimate_tokens(messages: list[BaseMessage]) -> int:
+    """Estimate the total token count of a message list without calling the API."""
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+def is_context_overflow_error(error: BaseException) -> bool:
+    """Check whether the provider rejected a request for being too long.
+
+    Newer langchain-core versions raise ContextOverflowError; older ones
+    surface the provider's own error (e.g. an Anthropic 400 "prompt is too
+    long", a Gemini "exceeds the maximum number of tokens"), so both the
+    class name and the message are checked.
+    """
+    if any(cls.__name__ == "ContextOverflowError" for cls in type(error).__mro__):
+        return True
+    return bool(_CONTEXT_OVERFLOW_MESSAGE.search(str(error)))
+
+
+def _get_max_tokens() -> int:
+    """Return the context window size of the current model."""
+    # For simple, we set claude model max token is 200_000, and gemini to 1_000_000
+    model = get_model()
+    if isinstance(model, ChatGoogleGenerativeAI):
+        return 1_000_000
+    if isinstance(model, ChatAnthropic):
+        return 200_000
+    return 200_000
+
+
+def _format_conversation(messages: list[BaseMessage]) -> str:
+    """Render messages as plain text for the summarization prompt."""
+    return "\n\n".join(
+        f"[{msg.__class__.__name__}]: {msg.content}"
+        for msg in messages
+    )
+
+
+def _chunk_messages(
+    messages: list[BaseMessage],
+    max_chars: int = SUMMARY_CHUNK_CHARS,
+) -> list[list[BaseMessage]]:
+    """Split messages into consecutive chunks of at most max_chars of text."""
+    chunks: list[list[BaseMessage]] = []
+    current: list[BaseMessage] = []
+    current_chars = 0
+    for message in messages:
+        message_chars = _content_length(message.content)
+        if current and current_chars + message_chars > max_chars:
+            chunks.append(current)
+            current, current_chars = [], 0
+        current.append(message)
+        current_chars += message_chars
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _invoke_prompt(prompt_name: str, **values: str) -> str:
+    """Fill a prompt template from src/prompt and run it on the model."""
+    prompt_path = Path(__file__).parent.parent / "prompt" / prompt_name
+    prompt = prompt_path.read_text()
+    for key, value in values.items():
+        prompt = prompt.replace("{" + key + "}", value)
+
+    # Use the same model to generate the summary
+    model = get_model()
+    response = await model.ainvoke([HumanMessage(content=prompt)])
+    return response.text
+
 
 async def _generate_summary(
-    messages_to_summarize: list[BaseMessage], 
+    messages_to_summarize: list[BaseMessage],
+    previous_summary: str = "",
 ) -> str:
-    """Generate a summary of the given messages.
-    
+    """Update the rolling summary with the given messages.
+
+    Only the messages added since the last compaction are sent, together
+    with the previous summary, so the cost no longer grows with the
+    session length. Large backlogs are split into chunks that are
+    summarized in parallel (map) and then merged into the summary (reduce).
+
     The summary captures:
     - Key decisions made
     - Important context established
@@ -38,28 +189,142 @@ async def _generate_summary(
         A summary string of the conversation.
     """
     if not messages_to_summarize:
-        return ""
-    
-    # Create a summarization prompt
-    conversation_text = "\n\n".join(
-        f"[{msg.__class__.__name__}]: {msg.content}" 
-        for msg in messages_to_summarize
-    )
-    
-    # Load prompt template from file
-    prompt_path = Path(__file__).parent.parent / "prompt" / "compaction_prompt.md"
-    prompt_template = prompt_path.read_text()
-    summary_prompt = prompt_template.replace("{conversation_text}", conversation_text)
+        return previous_summary
 
-    # Use the same model to generate the summary
-    model = create_model()
-    
     try:
-        response = await model.ainvoke([HumanMessage(content=summary_prompt)])
-        return str(response.content)
+        chunks = _chunk_messages(messages_to_summarize)
+        if len(chunks) == 1:
+            return await _invoke_prompt(
+                "compaction_prompt.md",
+                previous_summary=previous_summary or "(none)",
+                conversation_text=_format_conversation(chunks[0]),
+            )
+
+        # Map: summarize each chunk in parallel
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_SUMMARIES)
+
+        async def _summarize_chunk(chunk: list[BaseMessage]) -> str:
+            async with semaphore:
+                return await _invoke_prompt(
+                    "compaction_prompt.md",
+                    previous_summary="(none)",
+                    conversation_text=_format_conversation(chunk),
+                )
+
+        partial_summaries = await asyncio.gather(
+            *(_summarize_chunk(chunk) for chunk in chunks))
+
+        # Reduce: merge the partial summaries into the rolling summary
+        return await _invoke_prompt(
+            "compaction_merge_prompt.md",
+            previous_summary=previous_summary or "(none)",
+            partial_summaries="\n\n".join(
+                f"### Part {index}\n{summary}"
+                for index, summary in enumerate(partial_summaries, start=1)
+            ),
+        )
     except Exception as e:
-        # If summarization fails, create a basic summary
-        return f"[Previous conversation with {len(messages_to_summarize)} messages - summarization failed: {e}]"
+        # If summarization fails, keep the previous summary and note the gap
+        return (
+            f"{previous_summary}\n\n"
+            f"[Previous conversation with {len(messages_to_summarize)} messages - summarization failed: {e}]"
+        ).strip()
+
+
+def _split_summary(
+    messages: list[BaseMessage],
+) -> tuple[Optional[SystemMessage], str, int, list[BaseMessage]]:
+    """Split the history into system prompt, rolling summary and the rest.
+
+    Returns:
+        (system_message, previous_summary, summarized_count, remaining_messages)
+    """
+    system_message: Optional[SystemMessage] = None
+    remaining_messages = messages
+
+    if messages and isinstance(messages[0], SystemMessage):
+        system_message = messages[0]
+        remaining_messages = messages[1:]
+
+    if remaining_messages and isinstance(remaining_messages[0], SystemMessage):
+        match = _SUMMARY_HEADER.match(remaining_messages[0].text)
+        if match:
+            previous_summary = remaining_messages[0].text[match.end():].strip()
+            return (system_message, previous_summary, int(match.group(1)),
+                    remaining_messages[1:])
+
+    return system_message, "", 0, remaining_messages
+
+
+def _recent_split_index(messages: list[BaseMessage], recent_count: int) -> int:
+    """Index where the kept recent messages start.
+
+    Moves the split back so tool results are never separated from the AI
+    message holding their tool calls.
+    """
+    index = max(len(messages) - recent_count, 0)
+    while 0 < index < len(messages) and isinstance(messages[index], ToolMessage):
+        index -= 1
+    return index
+
+
+def _truncate_to_fit(messages: list[BaseMessage], token_limit: int) -> list[BaseMessage]:
+    """Truncate the largest tool results and prompts until the history fits.
+
+    Compaction keeps the recent messages verbatim, so an oversized one (e.g.
+    the tool result that overflowed the request) would make the next
+    request fail the same way. The middle of the largest text contents is
+    cut out; the truncated messages are copies.
+    """
+    excess = estimate_tokens(messages) - token_limit
+    if excess <= 0:
+        return messages
+
+    result = list(messages)
+    largest_first = sorted(
+        (index for index, message in enumerate(result)
+         if isinstance(message, (ToolMessage, HumanMessage)) and isinstance(message.content, str)),
+        key=lambda index: len(result[index].content),
+        reverse=True,
+    )
+    for index in largest_first:
+        if excess <= 0:
+            break
+        message = result[index]
+        content = message.content
+        marker = "\n... [{} characters truncated to fit the context window] ...\n"
+        keep = max(len(content) - excess * CHARS_PER_TOKEN - len(marker.format(len(content))),
+                   2 * MIN_TRUNCATED_CHARS) // 2
+        if 2 * keep >= len(content):
+            continue
+        truncated = message.model_copy(update={
+            "content": content[:keep] + marker.format(len(content) - 2 * keep) + content[-keep:],
+            "response_metadata": {},
+        })
+        excess -= estimate_message_tokens(message) - estimate_message_tokens(truncated)
+        result[index] = truncated
+
+    print(f"Prompt compaction: Truncated recent messages to fit {token_limit} tokens",
+          file=sys.stderr)
+    return result
+
+
+async def compact_messages_before_request(
+    messages: list[BaseMessage],
+    threshold: float = COMPACTION_THRESHOLD,
+    recent_count: int = RECENT_MESSAGES_TO_KEEP,
+) -> list[BaseMessage]:
+    """Pre-flight check: compact if the projected request size is too large.
+
+    Uses the local token estimator so a huge tool result is caught before
+    the request is sent, instead of after the provider rejects it.
+    """
+    return await compact_messages_if_needed(
+        messages=messages,
+        current_input_tokens=estimate_tokens(messages),
+        threshold=threshold,
+        recent_count=recent_count,
+    )
 
 
 async def compact_messages_if_needed(
@@ -67,53 +332,63 @@ async def compact_messages_if_needed(
     current_input_tokens: int,
     threshold: float = COMPACTION_THRESHOLD,
     recent_count: int = RECENT_MESSAGES_TO_KEEP,
+    force: bool = False,
 ) -> list[BaseMessage]:
     """Compact messages if approaching the context window limit.
+
+    When the kept recent messages alone exceed the limit, the largest of
+    them are truncated (see _truncate_to_fit).
+
+    Args:
+        force: Compact regardless of the token count, e.g. after the
+            provider rejected the request as too long.
+
     Returns:
         compacted_messages: The (potentially) compacted list of messages
     """
-    # For simple, we set claude model max token is 200_000, and gemini to 1_000_000
-    model = create_model()
-    max_token = 200_000
-    if isinstance(model, ChatGoogleGenerativeAI):
-        max_token = 1_000_000
-    if isinstance(model, ChatAnthropic):
-        max_token = 200_000
-    
-    if len(messages) <= recent_count + 1:
-        # Not enough messages to compact
-        return messages
-    
     # Calculate the threshold (80% of 200k = 160k tokens)
-    token_limit = int(max_token * threshold)
+    token_limit = int(_get_max_tokens() * threshold)
     
-    if current_input_tokens < token_limit:
+    if current_input_tokens < token_limit and not force:
         # Still under the limit, no compaction needed
         return messages
-    
+
+    compacted = await _summarize_old_messages(messages, recent_count)
+    return _truncate_to_fit(compacted, token_limit)
+
+
+async def _summarize_old_messages(
+    messages: list[BaseMessage],
+    recent_count: int,
+) -> list[BaseMessage]:
+    """Merge all but the recent messages into the rolling summary."""
+    if len(messages) <= recent_count + 1:
+        # Not enough messages to compact
+        return messages
+
     # Compaction is needed
-    # Extract system message (should be first)
-    system_message: Optional[SystemMessage] = None
-    remaining_messages = messages
-    
-    if messages and isinstance(messages[0], SystemMessage):
-        system_message = messages[0]
-        remaining_messages = messages[1:]
+    # Extract system message (should be first) and the rolling summary
+    system_message, previous_summary, summarized_count, remaining_messages = \
+        _split_summary(messages)
     
     if len(remaining_messages) <= recent_count:
         # Not enough non-system messages to compact
         return messages
     
     # Split into messages to summarize and recent messages to keep
-    messages_to_summarize = remaining_messages[:-recent_count]
-    recent_messages = remaining_messages[-recent_count:]
+    split_index = _recent_split_index(remaining_messages, recent_count)
+    if split_index == 0:
+        return messages
+    messages_to_summarize = remaining_messages[:split_index]
+    recent_messages = remaining_messages[split_index:]
     
-    # Generate summary
-    summary = await _generate_summary(messages_to_summarize)
+    # Merge only the new messages into the rolling summary
+    summary = await _generate_summary(messages_to_summarize, previous_summary)
+    summarized_count += len(messages_to_summarize)
     
     # Create the summary message as a SystemMessage with context
     summary_message = SystemMessage(
-        content=f"[CONVERSATION SUMMARY - Previous {len(messages_to_summarize)} messages]\n\n{summary}"
+        content=f"[CONVERSATION SUMMARY - Previous {summarized_count} messages]\n\n{summary}"
     )
     
     # Reconstruct the message list
@@ -125,5 +400,123 @@ async def compact_messages_if_needed(
     compacted_messages.append(summary_message)
     compacted_messages.extend(recent_messages)
     
-    print("Prompt compaction: Compacted messages")
+    print("Prompt compaction: Compacted messages", file=sys.stderr)
     return compacted_messages
+
+
+class BackgroundCompactor:
+    """Runs compaction in the background, overlapping with tool execution.
+
+    When usage crosses the soft threshold, compaction of a snapshot of the
+    history starts as a background task. Its result is swapped into the
+    history at the next turn boundary, keeping every message appended since
+    the snapshot. Crossing the hard threshold still blocks, as before.
+    """
+
+    def __init__(
+        self,
+        soft_threshold: float = SOFT_COMPACTION_THRESHOLD,
+        hard_threshold: float = COMPACTION_THRESHOLD,
+        recent_count: int = RECENT_MESSAGES_TO_KEEP,
+    ):
+        self.soft_threshold = soft_threshold
+        self.hard_threshold = hard_threshold
+        self.recent_count = recent_count
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: list[BaseMessage] = []
+
+    async def after_response(
+        self,
+        messages: list[BaseMessage],
+        current_input_tokens: int,
+    ) -> list[BaseMessage]:
+        """Check the reported usage after a model response.
+
+        Returns:
+            The (potentially) compacted list of messages
+        """
+        token_limit = _get_max_tokens()
+        if current_input_tokens >= int(token_limit * self.hard_threshold):
+            messages = await self._wait_and_swap_in(messages)
+            return await compact_messages_if_needed(
+                messages=messages,
+                current_input_tokens=current_input_tokens,
+                threshold=self.hard_threshold,
+                recent_count=self.recent_count,
+            )
+
+        if current_input_tokens >= int(token_limit * self.soft_threshold):
+            self._start(messages, current_input_tokens)
+        return messages
+
+    async def before_request(
+        self,
+        messages: list[BaseMessage],
+    ) -> list[BaseMessage]:
+        """Turn boundary: swap in a finished compaction, block only if needed.
+
+        Returns:
+            The (potentially) compacted list of messages
+        """
+        messages = self._swap_in(messages)
+        token_limit = int(_get_max_tokens() * self.hard_threshold)
+        if self._task is not None and estimate_tokens(messages) >= token_limit:
+            messages = await self._wait_and_swap_in(messages)
+        return await compact_messages_before_request(
+            messages=messages,
+            threshold=self.hard_threshold,
+            recent_count=self.recent_count,
+        )
+
+    def cancel(self):
+        """Cancel the running background compaction, if any."""
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self._snapshot = []
+
+    def _start(self, messages: list[BaseMessage], current_input_tokens: int):
+        """Start compacting a snapshot of the history in the background."""
+        if self._task is not None:
+            return
+        self._snapshot = list(messages)
+        self._task = asyncio.create_task(compact_messages_if_needed(
+            messages=self._snapshot,
+            current_input_tokens=current_input_tokens,
+            threshold=self.soft_threshold,
+            recent_count=self.recent_count,
+        ))
+        print("Prompt compaction: Started background compaction", file=sys.stderr)
+
+    async def _wait_and_swap_in(
+        self,
+        messages: list[BaseMessage],
+    ) -> list[BaseMessage]:
+        """Wait for the running background compaction and swap it in."""
+        if self._task is not None:
+            await asyncio.wait([self._task])
+        return self._swap_in(messages)
+
+    def _swap_in(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Replace the snapshot prefix with its compacted version if it is ready."""
+        if self._task is None or not self._task.done():
+            return messages
+
+        task, snapshot = self._task, self._snapshot
+        self._task, self._snapshot = None, []
+        if task.cancelled():
+            return messages
+        if task.exception() is not None:
+            print(f"Prompt compaction: Background compaction failed: {task.exception()}",
+                  file=sys.stderr)
+            return messages
+
+        compacted = task.result()
+        prefix_unchanged = (
+            len(messages) >= len(snapshot)
+            and all(a is b for a, b in zip(messages, snapshot))
+        )
+        if compacted is snapshot or not prefix_unchanged:
+            # Nothing was compacted, or the history was replaced meanwhile
+            return messages
+        return compacted + messages[len(snapshot):]